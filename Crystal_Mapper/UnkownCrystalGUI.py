@@ -6,8 +6,9 @@ matplotlib.use('QT5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
 
-from crystal_math import get_band_coordinates
+from crystal_math import band_coordinates_array
 from gui import PolePlot
+from hover import HoverAnnotation
 
 class AddBandDialog(QtWidgets.QDialog):
 
@@ -199,11 +200,11 @@ class UnknownCrystalPlot(FigureCanvas):
                                    QtWidgets.QSizePolicy.Expanding,
                                    QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
+        self.hover_annotation = HoverAnnotation(self, self.ax, decimals=1)
 
     def plot(self, poles):
         plt.cla()
         ax = self.ax
-        fig = self.fig
         plt.tight_layout()
         ax.spines['left'].set_position('zero')
         ax.spines['right'].set_color('none')
@@ -216,6 +217,11 @@ class UnknownCrystalPlot(FigureCanvas):
         plt.xlim(-45, 45)
         plt.ylim(-45, 45)
 
+        # trace every band of every checked pole in one call
+        bands = [[pole['x'], pole['y'], band[0]] for pole in poles
+                 if pole['checked'] for band in pole['bands']]
+        traces = iter(band_coordinates_array(bands) if bands else [])
+
         scs = []
         colors = []
         names = []
@@ -233,8 +239,9 @@ class UnknownCrystalPlot(FigureCanvas):
                 for band in pole['bands']:
                     markerSize = 3 if band[1] else 1
                     color = (0,0,0,0.75) if band[1] else (0.5,0.5,0.5,0.5)
-                    x,y = get_band_coordinates(pole['x'],pole['y'], band[0])
-                    scs.append(plt.scatter(x,y,c=color, marker='.', s=markerSize))
+                    trace = next(traces).compressed().reshape(-1, 2)
+                    scs.append(plt.scatter(trace[:, 0], trace[:, 1], c=color,
+                                           marker='.', s=markerSize))
                     names.append(''.join((pole['name'], ': Angle = ', str(band[0]))))
                     colors.append(color)
 
@@ -248,34 +255,8 @@ class UnknownCrystalPlot(FigureCanvas):
                             fontweight='bold')
         annot.set_visible(False)
 
-        def update_annot(sc, ind, color, i):
-
-            pos = sc.get_offsets()[ind["ind"][0]]
-            annot.xy = pos
-            #print(names)
-            text = ''.join((names[i],
-                            '\nX tilt = ', str(round(pos[0],1)),
-                            ', Y tilt = ', str(round(pos[1],1))))
-            annot.set_text(text)
-            annot.get_bbox_patch().set_facecolor(color)
-            annot.get_bbox_patch().set_alpha(0.8)
-
-        def hover(event):
-            vis = annot.get_visible()
-            if event.inaxes == ax:
-                for i, sc in enumerate(scs):
-                    cont, ind = sc.contains(event)
-                    if cont:
-                        update_annot(sc, ind, colors[i], i)
-                        annot.set_visible(True)
-                        fig.canvas.draw_idle()
-                        break
-                else:
-                    if vis:
-                        annot.set_visible(False)
-                        fig.canvas.draw_idle()
-
-        fig.canvas.mpl_connect("motion_notify_event", hover)
+        self.hover_annotation.annot = annot
+        self.hover_annotation.set_layers(zip(scs, names, colors))
 
         self.draw()
 
@@ -0,0 +1,210 @@
+"""
+Angles between pairs of lattice direction or plane families, for indexing
+crystals from the angles between measured poles.
+
+    table = get_angle_table(crystal.lattice, crystal.symmetry_key)
+    first, second, angles = table.query(54.7, 0.5)
+
+Poles are lines, so angles are between 0 and 90 degrees. Tables are built
+with one Gram matrix product, sorted by angle, and kept in memory and as
+.npy files in the user's cache directory so a lattice is only computed
+once.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from crystal_math import laue_operators
+from equivalent_planes import expand_families
+
+
+def _user_cache_dir():
+    # per user cache outside the source tree, like platformdirs' user cache
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = (os.environ.get('XDG_CACHE_HOME') or
+                os.path.expanduser(os.path.join('~', '.cache')))
+    return os.path.join(base, 'Crystal_Mapper', 'angle_tables')
+
+
+DEFAULT_CACHE_DIR = _user_cache_dir()
+
+# part of the cache key, increase when the table contents change
+FORMAT_VERSION = 1
+
+# one row per distinct (family, family, angle)
+_DTYPE = np.dtype([('angle', 'f8'), ('first_family', 'i4'),
+                   ('second_family', 'i4'), ('first', 'i4', 3),
+                   ('second', 'i4', 3)])
+
+
+def _canonical(indices):
+    # flip every row so its first nonzero index is positive
+    first = np.argmax(indices != 0, axis=1)
+    signs = np.sign(indices[np.arange(len(indices)), first])
+    return indices * np.where(signs == 0, 1, signs)[:, None]
+
+
+def pole_families(system='Triclinic', max_index=3, planes=False):
+    """
+    Symmetry distinct pole families with indices up to max_index.
+    :return: representatives, poles, family = (F,3) lowest index member of
+             every family, (N,3) all members with one sign, (N,) family
+             index of every pole.
+    """
+    indices = np.arange(-max_index, max_index + 1)
+    candidates = np.stack(np.meshgrid(indices, indices, indices,
+                                      indexing='ij'), axis=-1).reshape(-1, 3)
+    candidates = candidates[np.gcd.reduce(candidates, axis=1) == 1]
+    candidates = np.unique(_canonical(candidates), axis=0)
+    # low indices first, so they represent their families
+    order = np.lexsort((-candidates.min(axis=1), (candidates < 0).sum(axis=1),
+                        np.abs(candidates).sum(axis=1)))
+    poles, family = expand_families(candidates[order],
+                                    laue_operators(system, planes))
+    poles = _canonical(poles)
+    poles, first = np.unique(poles, axis=0, return_index=True)
+    family = family[first]
+    # renumber the families that kept members
+    used, family = np.unique(family, return_inverse=True)
+    representatives = _canonical(candidates[order][used])
+    return representatives, poles, family
+
+
+class AngleTable:
+    """
+    Sorted angles between every pair of pole families of one lattice.
+    Each row pairs the representative of the first family with a member
+    of the second family, one row per distinct angle.
+
+    angles: (P,) sorted angles in degrees.
+    first_family, second_family: (P,) indices into representatives.
+    first, second: (P,3) indices of the two poles.
+    """
+
+    def __init__(self, lattice, system='Triclinic', max_index=3,
+                 planes=False, rows=None):
+        self.lattice = lattice
+        self.system = system
+        self.max_index = max_index
+        self.planes = planes
+        self.representatives, poles, family = pole_families(
+            system, max_index, planes)
+        if rows is None:
+            rows = self._build(poles, family)
+        self.rows = rows
+        self.angles = rows['angle']
+        self.first_family = rows['first_family']
+        self.second_family = rows['second_family']
+        self.first = rows['first']
+        self.second = rows['second']
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _unit_vectors(self, indices):
+        if self.planes:
+            vectors = self.lattice.planes_to_cartesian(indices)
+        else:
+            vectors = self.lattice.directions_to_cartesian(indices)
+        return vectors / np.linalg.norm(vectors, axis=1)[:, None]
+
+    def _build(self, poles, family):
+        representatives = self.representatives
+        gram = np.abs(self._unit_vectors(representatives) @
+                      self._unit_vectors(poles).T)
+        angles = np.degrees(np.arccos(np.clip(gram, 0, 1)))
+        # unordered pairs of families, without a pole paired with itself.
+        # poles are reduced and distinct, so only that pair is parallel.
+        i, j = np.nonzero((family[None, :] >= np.arange(
+            len(representatives))[:, None]) & (angles > 1e-3))
+        keys = np.column_stack((i, family[j], np.round(angles[i, j], 6)))
+        _, first = np.unique(keys, axis=0, return_index=True)
+        i, j = i[first], j[first]
+
+        rows = np.empty(len(i), dtype=_DTYPE)
+        rows['angle'] = angles[i, j]
+        rows['first_family'] = i
+        rows['second_family'] = family[j]
+        rows['first'] = representatives[i]
+        rows['second'] = poles[j]
+        rows.sort(order=('angle', 'first_family', 'second_family'))
+        return rows
+
+    def range(self, low, high):
+        """Slice of the rows with low <= angle <= high, by binary search."""
+        return slice(np.searchsorted(self.angles, low, side='left'),
+                     np.searchsorted(self.angles, high, side='right'))
+
+    def query(self, angle, tolerance=0.5):
+        """
+        Pole pairs making an angle within tolerance of angle (degrees).
+        :return: first, second, angles = (M,3), (M,3) and (M,) arrays.
+        """
+        rows = self.range(angle - tolerance, angle + tolerance)
+        return self.first[rows], self.second[rows], self.angles[rows]
+
+    def save(self, path):
+        # write to a temporary file in the same directory and move it over
+        # the old file so readers never see a partial table
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                np.save(fp, self.rows, allow_pickle=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+_tables = {}
+
+
+def _table_key(lattice, system, max_index, planes):
+    return (FORMAT_VERSION, tuple(float(p) for p in lattice.parameters),
+            system, max_index, bool(planes))
+
+
+def _cache_path(key, cache_dir):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, 'angles_%s.npy' % digest)
+
+
+def _load_rows(path):
+    # rows of a cached table, None if missing, unreadable or of another
+    # layout
+    try:
+        rows = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    if rows.dtype != _DTYPE or rows.ndim != 1:
+        return None
+    return rows
+
+
+def get_angle_table(lattice, system='Triclinic', max_index=3, planes=False,
+                    cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Shared AngleTable of a lattice, loaded from or saved to cache_dir.
+    Cached files that can not be read as a table are rebuilt.
+    :param system: key of crystal_math.SYMMETRY_GENERATORS.
+    :param cache_dir: directory of .npy tables, None to keep them in memory
+                      only.
+    """
+    key = _table_key(lattice, system, max_index, planes)
+    if key in _tables:
+        return _tables[key]
+    rows = None
+    if cache_dir is not None:
+        path = _cache_path(key, cache_dir)
+        rows = _load_rows(path)
+    table = AngleTable(lattice, system, max_index, planes, rows)
+    if cache_dir is not None and rows is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        table.save(path)
+    _tables[key] = table
+    return table
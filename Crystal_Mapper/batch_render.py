@@ -0,0 +1,128 @@
+"""
+Render pole figures of a sample to image files with the Agg backend only.
+
+    python batch_render.py sample.json views.json -o plots --format svg
+
+The sample file is written by Sample.save. The views file is a list of
+views, each a dictionary with the optional keys
+    crystal:   name of the crystal, every crystal of the sample if omitted
+    interface: [alpha, beta, rotation] of an edge on interface
+    xlim, ylim: half width of the tilt window (degrees), default 45
+    profile:   marker profile name, the current profile if omitted
+    poles:     "direction" or "plane" for every family, as in the profile
+               if omitted
+    name:      file name without extension
+Views are rendered in parallel worker processes.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from crystal_math import Crystal, Sample
+from pole_renderer import PoleRenderer
+from profile_store import DEFAULT_PATH
+
+
+def render_view(crystal, view, path, markers=DEFAULT_PATH, size=(6, 6),
+                dpi=200):
+    """
+    Render one view of a crystal to an image file.
+    :param crystal: Crystal to plot.
+    :param view: dictionary of view options, see the module docstring.
+    :param path: output file, the format follows the extension.
+    :return: path
+    """
+    renderer = PoleRenderer(matplotlib.figure.Figure(figsize=size, dpi=dpi),
+                            markers=markers)
+    FigureCanvasAgg(renderer.fig)
+    interface = view.get('interface') or (None, None, None)
+    renderer.plot(crystal, *interface, xlim=view.get('xlim', 45),
+                  ylim=view.get('ylim', 45), profile=view.get('profile'),
+                  poles=view.get('poles'))
+    renderer.fig.savefig(path, facecolor=renderer.fig.get_facecolor())
+    return path
+
+
+def _render_job(job):
+    crystal, view, path, markers, size, dpi = job
+    return render_view(Crystal.from_dict(crystal), view, path, markers,
+                       size, dpi)
+
+
+def make_jobs(sample, views, output, fmt='png', markers=DEFAULT_PATH,
+              size=(6, 6), dpi=200):
+    """
+    One job per crystal and view, with the crystal as a dictionary so jobs
+    can be sent to worker processes.
+    """
+    markers = os.path.abspath(markers)
+    jobs = []
+    for number, view in enumerate(views):
+        if view.get('crystal') is None:
+            crystals = sample.crystals
+        else:
+            crystals = [sample.crystal(view['crystal'])]
+        for crystal in crystals:
+            name = view.get('name', 'view%03d' % number)
+            if len(crystals) > 1 or 'name' not in view:
+                name = '_'.join((crystal.name, name))
+            path = os.path.join(output, '.'.join((name, fmt)))
+            jobs.append((crystal.to_dict(), view, path, markers, size, dpi))
+    return jobs
+
+
+def render_sample(sample, views, output, fmt='png', markers=DEFAULT_PATH,
+                  size=(6, 6), dpi=200, workers=None):
+    """
+    Render every view of a sample across a process pool.
+    :param sample: Sample, or path of a sample file.
+    :param views: list of view dictionaries.
+    :param output: directory for the images, created if needed.
+    :param workers: number of processes, one per CPU if None.
+    :return: list of written paths.
+    """
+    if isinstance(sample, str):
+        sample = Sample(sample)
+    os.makedirs(output, exist_ok=True)
+    jobs = make_jobs(sample, views, output, fmt, markers, size, dpi)
+    if workers == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render pole figures of a sample without a display.')
+    parser.add_argument('sample', help='sample file written by Sample.save')
+    parser.add_argument('views', help='JSON file with a list of views')
+    parser.add_argument('-o', '--output', default='.',
+                        help='output directory')
+    parser.add_argument('-f', '--format', default='png',
+                        help='image format, e.g. png, svg or pdf')
+    parser.add_argument('-m', '--markers', default=DEFAULT_PATH,
+                        help='marker profile file')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes, one per CPU by default')
+    parser.add_argument('--size', type=float, nargs=2, default=(6, 6),
+                        metavar=('WIDTH', 'HEIGHT'),
+                        help='figure size in inches')
+    parser.add_argument('--dpi', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with open(args.views, 'r') as fp:
+        views = json.load(fp)
+    for path in render_sample(args.sample, views, args.output, args.format,
+                              args.markers, tuple(args.size), args.dpi,
+                              args.jobs):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
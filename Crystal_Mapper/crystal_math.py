@@ -1,70 +1,346 @@
 import math
+import functools
+import json
+import re
 import numpy as np
 import matplotlib.pyplot as plt
 
+from instrumentation import instrument
+
 
 def misorientation_matrix(crystal_A, crystal_B):
-    matrix = np.zeros((3,3))
-    directions = [[1,0,0], [0,1,0], [0,0,1]]
-    for i in range(3):
-        for j in range(3):
-            alpha_A, beta_A = stage_coordinates(directions[i],
-                                                crystal_A.beam_direction,
-                                                crystal_A.a0, crystal_A.b0,
-                                                crystal_A.reference_direction,
-                                                crystal_A.rotation_correction)
-            alpha_A = np.round(np.deg2rad(alpha_A),2)
-            beta_A = np.round(np.deg2rad(beta_A),2)
-            alpha_B, beta_B = stage_coordinates(directions[j],
-                                                crystal_B.beam_direction,
-                                                crystal_B.a0, crystal_B.b0,
-                                                crystal_B.reference_direction,
-                                                crystal_B.rotation_correction)
-            alpha_B = np.round(np.deg2rad(alpha_B),2)
-            beta_B = np.round(np.deg2rad(beta_B),2)
-            matrix[i,j] = np.round((np.sin(alpha_A)*np.sin(alpha_B) +
-                np.cos(alpha_A)*np.cos(alpha_B)*np.cos(beta_A-beta_B)),2)
-
-    angle = np.rad2deg(np.arccos((matrix[0,0] + matrix[1,1] + matrix[2,2] - 1)*0.5))
-    axis = [matrix[1,2] - matrix[2,1],
-            matrix[2,0] - matrix[0,2],
-            matrix[0, 1] - matrix[1, 0]]
-    print(angle)
-    print(axis)
-    return matrix
+    # matrix[i,j] is the cosine between cartesian axis i of crystal A and
+    # cartesian axis j of crystal B.
+    return crystal_A.orientation_matrix.T @ crystal_B.orientation_matrix
+
 
+@instrument
+def misorientations(crystals):
+    """
+    Misorientation angle and axis between every pair of crystals, for
+    example all of Sample.crystals.
+    :param crystals: list of N Crystal objects.
+    :return: angles, axes = (N,N) array of angles (degrees) and (N,N,3)
+             array of unit axes in the cartesian frame of the first crystal
+             of each pair. Axes of zero angle misorientations are zero.
+    """
+    orientations = np.array([c.orientation_matrix for c in crystals])
+    matrices = np.einsum('aki,bkj->abij', orientations, orientations)
+    return _angle_axis(matrices)
+
+
+def _angle_axis(matrices):
+    # Rotation angle (degrees) and unit axis of a stack of rotation matrices.
+    # The axis sign follows misorientation_matrix's original convention.
+    trace = np.trace(matrices, axis1=-2, axis2=-1)
+    angles = np.rad2deg(np.arccos(np.clip((trace - 1) * 0.5, -1.0, 1.0)))
+    axes = np.stack((matrices[..., 1, 2] - matrices[..., 2, 1],
+                     matrices[..., 2, 0] - matrices[..., 0, 2],
+                     matrices[..., 0, 1] - matrices[..., 1, 0]), axis=-1)
+
+    # near 180 degrees the antisymmetric part vanishes. The symmetric part
+    # is cos(angle) I + (1 - cos(angle)) k k^T, and a column of k k^T gives
+    # k up to its sign, which is taken from what is left of the
+    # antisymmetric part.
+    half_turn = angles > 179
+    if np.any(half_turn):
+        cosines = np.cos(np.deg2rad(angles[half_turn]))[:, None, None]
+        symmetric = (matrices[half_turn] +
+                     np.swapaxes(matrices[half_turn], -1, -2)) * 0.5
+        outer = (symmetric - cosines * np.eye(3)) / (1 - cosines)
+        column = np.argmax(np.diagonal(outer, axis1=-2, axis2=-1), axis=-1)
+        columns = outer[np.arange(len(outer)), :, column]
+        signs = np.where(np.sum(columns * axes[half_turn], axis=-1) < 0,
+                         -1, 1)
+        axes[half_turn] = columns * signs[:, None]
+
+    norms = np.linalg.norm(axes, axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        axes = np.where(norms > 1e-9, axes / norms, 0)
+    return angles, axes
+
+
+# region symmetry
+# Generators of the proper rotation point groups, acting on lattice
+# direction indices [u,v,w]. Trigonal uses rhombohedral axes, as set up by
+# CrystalSelector, unless hexagonal axes are requested.
+SYMMETRY_GENERATORS = {
+    'Triclinic': [],
+    'Monoclinic': [[[-1, 0, 0], [0, -1, 0], [0, 0, 1]]],
+    'Orthorhombic': [[[-1, 0, 0], [0, -1, 0], [0, 0, 1]],
+                     [[-1, 0, 0], [0, 1, 0], [0, 0, -1]]],
+    'Tetragonal': [[[0, -1, 0], [1, 0, 0], [0, 0, 1]],
+                   [[1, 0, 0], [0, -1, 0], [0, 0, -1]]],
+    'Trigonal': [[[0, 0, 1], [1, 0, 0], [0, 1, 0]],
+                 [[0, -1, 0], [-1, 0, 0], [0, 0, -1]]],
+    'Trigonal (hexagonal axes)': [[[0, -1, 0], [1, -1, 0], [0, 0, 1]],
+                                  [[1, -1, 0], [0, -1, 0], [0, 0, -1]]],
+    'Hexagonal': [[[1, -1, 0], [1, 0, 0], [0, 0, 1]],
+                  [[1, -1, 0], [0, -1, 0], [0, 0, -1]]],
+    'Cubic': [[[0, -1, 0], [1, 0, 0], [0, 0, 1]],
+              [[1, 0, 0], [0, -1, 0], [0, 0, -1]],
+              [[0, 0, 1], [1, 0, 0], [0, 1, 0]]],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def lattice_symmetry_operators(system):
+    """
+    Proper rotations of a crystal system's point group.
+    :param system: key of SYMMETRY_GENERATORS.
+    :return: (K,3,3) integer array acting on lattice direction indices.
+    """
+    operators = [np.eye(3, dtype=int)]
+    seen = {operators[0].tobytes()}
+    generators = [np.array(g, dtype=int) for g in SYMMETRY_GENERATORS[system]]
+    for operator in operators:
+        for generator in generators:
+            product = generator @ operator
+            if product.tobytes() not in seen:
+                seen.add(product.tobytes())
+                operators.append(product)
+    operators = np.array(operators)
+    operators.setflags(write=False)
+    return operators
+
+
+@functools.lru_cache(maxsize=None)
+def laue_operators(system, planes=False):
+    """
+    Operators of a crystal system's Laue class, the point group rotations
+    and their products with the inversion. Poles are centrosymmetric, so
+    these give all equivalent zone axes of a family.
+    :param system: key of SYMMETRY_GENERATORS.
+    :param planes: operators on plane indices (hkl) rather than directions,
+                   i.e. the inverse transpose of each direction operator.
+    :return: (2K,3,3) integer array acting on lattice direction indices,
+             the proper rotations first.
+    """
+    rotations = lattice_symmetry_operators(system)
+    if planes:
+        rotations = np.rint(np.linalg.inv(rotations)).astype(int)
+        rotations = np.swapaxes(rotations, -1, -2)
+    operators = np.concatenate((rotations, -rotations))
+    operators.setflags(write=False)
+    return operators
+
+
+def _symmetry_key(system, alpha, beta, gamma):
+    # Name used in SYMMETRY_GENERATORS for a crystal system and its angles.
+    system = system.capitalize()
+    if (system == 'Trigonal' and np.isclose(alpha, 90) and
+            np.isclose(beta, 90) and np.isclose(gamma, 120)):
+        return 'Trigonal (hexagonal axes)'
+    return system
+
+
+@instrument
+def disorientations(crystals):
+    """
+    Misorientation between every pair of crystals reduced by the crystal
+    symmetry, i.e. the smallest rotation over all symmetry equivalent
+    orientations of both crystals.
+    :param crystals: list of N Crystal objects.
+    :return: angles, axes = (N,N) array of angles (degrees) and (N,N,3)
+             array of unit axes, like misorientations.
+    """
+    orientations = np.array([c.orientation_matrix for c in crystals])
+    matrices = np.einsum('aki,bkj->abij', orientations, orientations)
+
+    # crystals sharing symmetry operators are reduced as one block
+    groups = {}
+    for idx, crystal in enumerate(crystals):
+        key = (crystal.symmetry_key, crystal.lattice.parameters)
+        groups.setdefault(key, []).append(idx)
+    operators = {key: crystals[idx[0]].symmetry_operators
+                 for key, idx in groups.items()}
+
+    reduced = np.empty_like(matrices)
+    for key_A, idx_A in groups.items():
+        for key_B, idx_B in groups.items():
+            block = matrices[np.ix_(idx_A, idx_B)]
+            ops_A = operators[key_A]
+            ops_B = operators[key_B]
+            # trace of S_A^T M S_B for every operator pair
+            traces = np.einsum('pji,nmjk,qki->nmpq', ops_A, block, ops_B,
+                               optimize=True)
+            traces = traces.reshape(traces.shape[:2] + (-1,))
+            best_A, best_B = np.divmod(np.argmax(traces, axis=-1),
+                                       len(ops_B))
+            reduced[np.ix_(idx_A, idx_B)] = (
+                np.swapaxes(ops_A[best_A], -1, -2) @ block @ ops_B[best_B])
+    return _angle_axis(reduced)
+
+
+def disorientation(crystal_A, crystal_B):
+    """Symmetry reduced misorientation angle (degrees) and axis."""
+    angles, axes = disorientations([crystal_A, crystal_B])
+    return angles[0, 1], axes[0, 1]
+# endregion
 
 
-def along_interface_tilt_coordinates(
-        alpha, beta, rotation=0, step_size=0.1):
+# region extinction
+# lattice translations of the conventional cell of each centering
+CENTERING_TRANSLATIONS = {
+    'P': [[0, 0, 0]],
+    'A': [[0, 0, 0], [0, 1/2, 1/2]],
+    'B': [[0, 0, 0], [1/2, 0, 1/2]],
+    'C': [[0, 0, 0], [1/2, 1/2, 0]],
+    'I': [[0, 0, 0], [1/2, 1/2, 1/2]],
+    'F': [[0, 0, 0], [0, 1/2, 1/2], [1/2, 0, 1/2], [1/2, 1/2, 0]],
+    # rhombohedral lattice on hexagonal axes, obverse setting
+    'R': [[0, 0, 0], [2/3, 1/3, 1/3], [1/3, 2/3, 2/3]],
+}
+
+
+def _atom_positions(centering='P', basis=None):
+    # fractional positions and scattering factors of every atom in the cell
+    translations = np.array(CENTERING_TRANSLATIONS[centering], dtype=float)
+    if basis is None:
+        basis = [[0, 0, 0]]
+    basis = np.array([list(atom) + [1] * (4 - len(atom)) for atom in basis],
+                     dtype=float)
+    positions = translations[:, None, :] + basis[None, :, :3]
+    weights = np.broadcast_to(basis[:, 3], positions.shape[:2])
+    return positions.reshape(-1, 3), weights.ravel()
+
+
+@instrument
+def structure_factors(planes, centering='P', basis=None):
     """
-    Give tilt coordinates to tilt in the normal direction across an interface
-    that is on edge ata certain alpha and beta tilt.
+    Kinematic structure factors of reflections.
+    :param planes: (h,k,l) or (N,3) array of plane indices.
+    :param centering: key of CENTERING_TRANSLATIONS.
+    :param basis: atoms repeated at every lattice point, each [x, y, z] or
+                  [x, y, z, f] in fractional coordinates with scattering
+                  factor f (default 1). One atom at the origin if None.
+    :return: complex structure factor or (N,) array of them.
+    """
+    positions, weights = _atom_positions(centering, basis)
+    phases = np.exp(2j * np.pi * (np.asarray(planes, dtype=float) @
+                                  positions.T))
+    return phases @ weights
+
+
+class ExtinctionTable:
+    """
+    Allowed reflections of one centering and basis, computed once for
+    every (hkl) with indices up to max_index and then looked up by index.
+    A reflection is extinct if its intensity is below tolerance times the
+    largest possible intensity.
+    """
+
+    def __init__(self, centering='P', basis=None, max_index=12,
+                 tolerance=1e-6):
+        self.centering = centering
+        self.basis = basis
+        self.max_index = max_index
+        self.tolerance = tolerance
+        _, weights = _atom_positions(centering, basis)
+        self._limit = tolerance * np.abs(weights).sum() ** 2
+
+        indices = np.arange(-max_index, max_index + 1)
+        planes = np.stack(np.meshgrid(indices, indices, indices,
+                                      indexing='ij'), axis=-1)
+        self.intensities = np.abs(structure_factors(
+            planes.reshape(-1, 3), centering, basis)).reshape(
+            planes.shape[:3]) ** 2
+        self.table = self.intensities > self._limit
+        for array in (self.intensities, self.table):
+            array.setflags(write=False)
+
+    def allowed(self, planes):
+        """
+        :param planes: (h,k,l) or (N,3) array of integer plane indices.
+        :return: bool or (N,) bool array, False for extinct reflections.
+        """
+        planes = np.asarray(planes, dtype=int)
+        rows = np.atleast_2d(planes)
+        allowed = np.empty(len(rows), dtype=bool)
+        inside = (np.abs(rows) <= self.max_index).all(axis=1)
+        i, j, k = (rows[inside] + self.max_index).T
+        allowed[inside] = self.table[i, j, k]
+        if not inside.all():
+            allowed[~inside] = np.abs(structure_factors(
+                rows[~inside], self.centering, self.basis)) ** 2 > self._limit
+        return allowed[0] if planes.ndim == 1 else allowed
+
+    def lowest_orders(self, planes):
+        """
+        Lowest order n of each (hkl) for which n(hkl) reflects, trying the
+        orders with indices up to max_index.
+        :param planes: (h,k,l) or (N,3) array of integer plane indices.
+        :return: int or (N,) int array, 0 where no order reflects.
+        """
+        planes = np.asarray(planes, dtype=int)
+        rows = np.atleast_2d(planes)
+        largest = np.abs(rows).max(axis=1)
+        orders = np.zeros(len(rows), dtype=int)
+        for n in range(1, self.max_index + 1):
+            # the first order is always tried, even outside the table
+            untried = np.flatnonzero((orders == 0) &
+                                     ((n == 1) | (n * largest <=
+                                                  self.max_index)))
+            if not len(untried):
+                break
+            orders[untried[self.allowed(n * rows[untried])]] = n
+        return orders[0] if planes.ndim == 1 else orders
+# endregion
+
+
+@instrument
+def interface_tilt_path(alpha, beta, rotation=0, step_size=0.1,
+                        alpha_max=None, beta_max=None):
+    """
+    Tilt coordinates that keep an interface on edge while tilting about an
+    axis at a given rotation from the alpha tilt axis.
     :param alpha: alpha (x) tilt amount where interface is on edge. (degrees)
     :param beta: beta (y) tilt amount where interface is on edge. (degrees)
-    :param rotation: angle between alpha tilt axis and interface edge. (deg)
+    :param rotation: angle between alpha tilt axis and tilt direction. (deg)
+                     Use the interface rotation to tilt along the interface
+                     and the interface rotation + 90 to tilt across it.
     :param step_size: absolute angle in degrees between returned coordinates.
-    :return: list of [x,y] coordinates to tilt along interface. (degrees)
+    :param alpha_max: if given, only keep coordinates with |x| < alpha_max.
+    :param beta_max: if given, only keep coordinates with |y| < beta_max.
+    :return: (N,2) array of [x,y] coordinates. (degrees)
     """
-
-    out = [] # coordinate list
     sin_alpha = np.sin(np.deg2rad(alpha))  # radians
     cos_alpha = np.cos(np.deg2rad(alpha))  # radians
     cos_phi = np.cos(np.deg2rad(rotation))  # radians, rotation
     sin_phi = np.sin(np.deg2rad(rotation))  # radians, rotation
 
-    for theta in np.arange(-90, 90, step_size):
-        sin_theta = np.sin(np.deg2rad(theta))  # radians
-        cos_theta = np.cos(np.deg2rad(theta))  # radians
-        tan_theta = np.tan(np.deg2rad(theta))  # radians
+    theta = np.deg2rad(np.arange(-90, 90, step_size))
+    sin_theta = np.sin(theta)
+    cos_theta = np.cos(theta)
+    tan_theta = np.tan(theta)
+    with np.errstate(divide='ignore', invalid='ignore'):
         x = np.round(np.rad2deg(np.arcsin(
-            sin_theta * cos_phi * cos_alpha + sin_alpha * cos_theta)),2)
+            sin_theta * cos_phi * cos_alpha + sin_alpha * cos_theta)), 2)
         y = np.round(np.rad2deg(np.arctan(
             (tan_theta * sin_phi) /
             (cos_alpha - sin_alpha * tan_theta * cos_phi))) + beta, 2)
-        out.append([x,y])
 
-    return out
+    # holder limits
+    keep = np.ones(len(theta), dtype=bool)
+    if alpha_max is not None:
+        keep &= np.abs(x) < alpha_max
+    if beta_max is not None:
+        keep &= np.abs(y) < beta_max
+    return np.column_stack((x[keep], y[keep]))
+
+
+def along_interface_tilt_coordinates(
+        alpha, beta, rotation=0, step_size=0.1):
+    """
+    Give tilt coordinates to tilt in the normal direction across an interface
+    that is on edge ata certain alpha and beta tilt.
+    :param alpha: alpha (x) tilt amount where interface is on edge. (degrees)
+    :param beta: beta (y) tilt amount where interface is on edge. (degrees)
+    :param rotation: angle between alpha tilt axis and interface edge. (deg)
+    :param step_size: absolute angle in degrees between returned coordinates.
+    :return: list of [x,y] coordinates to tilt along interface. (degrees)
+    """
+    return interface_tilt_path(alpha, beta, rotation, step_size).tolist()
 
 
 def normal_to_interface_tilt_coordinates(
@@ -78,49 +354,45 @@ def normal_to_interface_tilt_coordinates(
     :param step_size: absolute angle in degrees between returned coordinates.
     :return: list of [x,y] coordinates to tilt along interface. (degrees)
     """
+    return interface_tilt_path(alpha, beta, rotation + 90, step_size).tolist()
 
-    out = [] # coordinate list
-    sin_alpha = np.sin(np.deg2rad(alpha))  # radians
-    cos_alpha = np.cos(np.deg2rad(alpha))  # radians
-    cos_phi_90 = np.cos(np.deg2rad(rotation + 90))  # radians, rotation
-    sin_phi_90 = np.sin(np.deg2rad(rotation + 90))  # radians, rotation
-
-    for theta in np.arange(-90, 90, step_size):
-        sin_theta = np.sin(np.deg2rad(theta))  # radians
-        cos_theta = np.cos(np.deg2rad(theta))  # radians
-        tan_theta = np.tan(np.deg2rad(theta))  # radians
-        x = np.round(np.rad2deg(np.arcsin(
-            sin_theta * cos_phi_90 * cos_alpha + sin_alpha * cos_theta)),2)
-        y = np.round(np.rad2deg(np.arctan(
-            (tan_theta * sin_phi_90) /
-            (cos_alpha - sin_alpha * tan_theta * cos_phi_90))) + beta, 2)
-        out.append([x,y])
+def get_band_coordinates(xtilt, ytilt, rotation, step_size=0.1):
+    traces = band_coordinates_array([[xtilt, ytilt, rotation]], step_size)[0]
+    inside = ~np.ma.getmaskarray(traces)[:, 0]
+    return traces.data[inside, 0].tolist(), traces.data[inside, 1].tolist()
 
-    return out
 
-def get_band_coordinates(xtilt, ytilt, rotation, step_size=0.1):
-    x = []
-    y = []
-    sin_alpha = np.sin(np.deg2rad(xtilt))
-    cos_alpha = np.cos(np.deg2rad(xtilt))
-    sin_beta = np.sin(np.deg2rad(ytilt))
-    cos_beta = np.cos(np.deg2rad(ytilt))
-    cos_rotation = np.cos(np.deg2rad(rotation))
-    sin_rotation = np.sin(np.deg2rad(rotation))
-
-    for i in np.arange(-90,90,step_size):
-        sin_i = np.sin(np.deg2rad(i))
-        cos_i = np.cos(np.deg2rad(i))
-        tan_i = np.tan(np.deg2rad(i))
-        next_x = np.rad2deg(
+@instrument
+def band_coordinates_array(bands, step_size=0.1, radius=45):
+    """
+    Traces of many Kikuchi bands at once.
+    :param bands: (N,3) array of [pole x tilt, pole y tilt, band angle] where
+                  the band angle is measured from the x tilt axis. (degrees)
+    :param step_size: angle in degrees between points along each band.
+    :param radius: points further than this from zero tilt are masked.
+    :return: (N,M,2) masked array of [x,y] points along each band. (degrees)
+    """
+    bands = np.atleast_2d(np.asarray(bands, dtype=float))
+    sin_alpha = np.sin(np.deg2rad(bands[:, 0:1]))
+    cos_alpha = np.cos(np.deg2rad(bands[:, 0:1]))
+    cos_rotation = np.cos(np.deg2rad(bands[:, 2:3]))
+    sin_rotation = np.sin(np.deg2rad(bands[:, 2:3]))
+
+    i = np.deg2rad(np.arange(-90, 90, step_size))
+    sin_i = np.sin(i)
+    cos_i = np.cos(i)
+    tan_i = np.tan(i)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.rad2deg(
             np.arcsin(sin_i*cos_rotation*cos_alpha + sin_alpha * cos_i))
-        next_y = (np.rad2deg(
+        y = (np.rad2deg(
             np.arctan(tan_i*sin_rotation/cos_alpha - sin_alpha*tan_i*cos_rotation))
-            + ytilt)
-        if np.sqrt(next_x**2 + next_y**2) <= 45:
-            x.append(next_x)
-            y.append(next_y)
-    return x,y
+            + bands[:, 1:2])
+        outside = ~(np.sqrt(x**2 + y**2) <= radius)
+
+    traces = np.stack((x, y), axis=-1)
+    return np.ma.masked_array(
+        traces, mask=np.repeat(outside[:, :, None], 2, axis=2))
 
 # region pole plot
 def unit_vector(vector):
@@ -213,10 +485,10 @@ def old_stage_coordinates(direction, zone_axis, za_alpha_tilt, za_beta_tilt,
     alpha = 0 if math.isnan(alpha) else alpha
     beta = 0 if math.isnan(beta) else beta
 
-    print(alpha, beta)
     return alpha, beta
 
 
+@instrument
 def stage_coordinates(direction, zone_axis, a0, b0, reference_pole, rotation):
     # Returns alpha and beta tilt directions (in degrees) for specified
     # direction and crystal orientation.
@@ -276,71 +548,216 @@ def stage_coordinates(direction, zone_axis, a0, b0, reference_pole, rotation):
     alpha = np.round(np.rad2deg(alpha), 2)
     beta = np.round(np.rad2deg(beta), 2)
 
-    try:
-        if direction[0] == 1 and direction[1] == 1 and direction[2] == 1:
-            print(direction, alpha, beta)
-    except:
-        print('what is wrong?')
+    return alpha, beta
+
 
+@instrument
+def stage_coordinates_array(directions, zone_axis, a0, b0, reference_pole,
+                            rotation):
+    """
+    Batched version of stage_coordinates for many directions sharing one
+    crystal orientation.
+    :param directions: (N,3) array of cartesian directions.
+    :param zone_axis: a known zone axis with known tilt coordinates
+    :param a0: alpha tilt of zone_axis (degrees)
+    :param b0: beta tilt of zone_axis (degrees)
+    :param reference_pole: pole for which the rotation angle is known.
+    :param rotation: angle about the zone_axis between the projected reference
+                     pole and the alpha stage pole. (degrees)
+    :return: (N,2) array of [alpha, beta] tilts. (degrees)
+    """
+    directions = np.atleast_2d(np.asarray(directions, dtype=float))
+    zone_axis = np.asarray(zone_axis, dtype=float)
+    reference_pole = np.asarray(reference_pole, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zone_unit = unit_vector(zone_axis)
+        direction_units = (directions /
+                           np.linalg.norm(directions, axis=1)[:, None])
+        gamma = np.arccos(np.clip(direction_units @ zone_unit, -1.0, 1.0))
+
+        direction_projected = np.cross(directions, zone_axis)
+        direction_projected = (
+            direction_projected /
+            np.linalg.norm(direction_projected, axis=1)[:, None])
+        reference_projected = unit_vector(np.cross(reference_pole, zone_axis))
+
+        ortho_to_ref = np.cross(zone_axis, reference_projected)
+        dot = direction_projected @ ortho_to_ref
+
+        # Directions parallel to the zone axis have no projection, which
+        # leaves phi as NaN. Those go to phi = 0 like the scalar version.
+        phi = np.arccos(np.clip(direction_projected @ reference_projected,
+                                -1.0, 1.0))
+        phi = np.where(dot < 0, np.deg2rad(360) - phi, phi)
+        phi = phi + np.deg2rad(rotation)
+        phi = np.where(np.isnan(phi), 0, phi)
+
+        sin_gamma = np.round(np.sin(gamma), 4)
+        cos_gamma = np.round(np.cos(gamma), 4)
+        tan_gamma = np.round(np.tan(gamma), 4)
+        sin_phi = np.round(np.sin(phi), 4)
+        cos_phi = np.round(np.cos(phi), 4)
+        sin_a0 = np.round(np.sin(np.deg2rad(a0)), 4)
+        cos_a0 = np.round(np.cos(np.deg2rad(a0)), 4)
+
+        alpha = np.arcsin((sin_gamma * cos_phi * cos_a0 + sin_a0 * cos_gamma))
+        beta = np.arctan((tan_gamma * sin_phi) / (
+                    cos_a0 - sin_a0 * tan_gamma * cos_phi)) + np.deg2rad(b0)
+
+        alpha, beta = _fold_tilts(alpha, beta, np.rad2deg(gamma) > 90,
+                                  np.round(np.deg2rad(180), 4))
+
+    return np.column_stack((np.round(np.rad2deg(alpha), 2),
+                            np.round(np.rad2deg(beta), 2)))
+
+
+def _fold_tilts(alpha, beta, lower, half_turn=np.pi):
+    # Apply the stage_coordinates conventions for directions more than 90
+    # degrees from the zone axis, using masks so it works on arrays.
+    # alpha and beta are in radians.
+    alpha = np.where(lower, half_turn - alpha, alpha)
+    alpha = np.where(np.rad2deg(alpha) > 180.5, alpha - 2 * half_turn, alpha)
+    flipped = np.abs(np.rad2deg(alpha) - 180) < 0.5
+    alpha = np.where(flipped, 0, alpha)
+    beta = np.where(flipped, beta - half_turn, beta)
+    beta = np.where(np.rad2deg(beta) < -180, beta + 2 * half_turn, beta)
     return alpha, beta
 
+
+@instrument
+def orientation_matrix(zone_axis, a0, b0, reference_pole, rotation):
+    """
+    Rotation matrix taking cartesian crystal directions to stage directions.
+    A stage direction for tilts (alpha, beta) is
+    [sin(alpha), cos(alpha)*sin(beta), cos(alpha)*cos(beta)].
+    :param zone_axis: a known zone axis with known tilt coordinates
+    :param a0: alpha tilt of zone_axis (degrees)
+    :param b0: beta tilt of zone_axis (degrees)
+    :param reference_pole: pole for which the rotation angle is known.
+    :param rotation: angle about the zone_axis between the projected reference
+                     pole and the alpha stage pole. (degrees)
+    :return: 3x3 rotation matrix.
+    """
+    zone = unit_vector(np.asarray(zone_axis, dtype=float))
+    reference = np.asarray(reference_pole, dtype=float)
+    reference = unit_vector(reference - np.dot(reference, zone) * zone)
+
+    # zone axis frame, x is the projected reference turned by -rotation
+    cos_rot = np.cos(np.deg2rad(rotation))
+    sin_rot = np.sin(np.deg2rad(rotation))
+    x = cos_rot * reference - sin_rot * np.cross(zone, reference)
+    frame = np.array([x, np.cross(zone, x), zone])
+
+    cos_a0 = np.cos(np.deg2rad(a0))
+    sin_a0 = np.sin(np.deg2rad(a0))
+    cos_b0 = np.cos(np.deg2rad(b0))
+    sin_b0 = np.sin(np.deg2rad(b0))
+    alpha_tilt = np.array([[cos_a0, 0, sin_a0],
+                           [0, 1, 0],
+                           [-sin_a0, 0, cos_a0]])
+    beta_tilt = np.array([[1, 0, 0],
+                          [0, cos_b0, sin_b0],
+                          [0, -sin_b0, cos_b0]])
+    return beta_tilt @ alpha_tilt @ frame
+
+
+@instrument
+def stage_vectors(alpha, beta):
+    """
+    Stage directions along the beam for the given tilts.
+    :param alpha: alpha tilt(s) (degrees)
+    :param beta: beta tilt(s) (degrees)
+    :return: (...,3) array of unit vectors in the stage frame.
+    """
+    alpha = np.deg2rad(alpha)
+    beta = np.deg2rad(beta)
+    alpha, beta = np.broadcast_arrays(alpha, beta)
+    return np.stack((np.sin(alpha),
+                     np.cos(alpha) * np.sin(beta),
+                     np.cos(alpha) * np.cos(beta)), axis=-1)
+
+
+@instrument
+def stage_coordinates_from_matrix(directions, orientation, b0):
+    """
+    Tilts for cartesian directions using a precomputed orientation matrix.
+    Uses the same conventions as stage_coordinates, except that the 180
+    degree alpha fold is applied to directions below the beta tilted stage
+    plane rather than to directions more than 90 degrees from the zone axis.
+    The two agree whenever the zone axis has no alpha tilt.
+    :param directions: (N,3) array of cartesian directions.
+    :param orientation: matrix from orientation_matrix.
+    :param b0: beta tilt of the zone axis used to build orientation (degrees)
+    :return: (N,2) array of [alpha, beta] tilts. (degrees)
+    """
+    directions = np.atleast_2d(np.asarray(directions, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        directions = (directions /
+                      np.linalg.norm(directions, axis=1)[:, None])
+        vectors = directions @ orientation.T
+
+        # undo the beta tilt of the zone axis, it is added back to beta
+        b0 = np.deg2rad(b0)
+        y = np.cos(b0) * vectors[:, 1] - np.sin(b0) * vectors[:, 2]
+        z = np.sin(b0) * vectors[:, 1] + np.cos(b0) * vectors[:, 2]
+
+        # directions along the alpha axis have no beta, use 0
+        ratio = y / z
+        ratio = np.where(np.isnan(ratio), 0, ratio)
+        alpha = np.arcsin(np.clip(vectors[:, 0], -1.0, 1.0))
+        beta = np.arctan(ratio) + b0
+        alpha, beta = _fold_tilts(alpha, beta, z < 0)
+
+    return np.column_stack((np.round(np.rad2deg(alpha), 2),
+                            np.round(np.rad2deg(beta), 2)))
+
+
 def zero_tilt_direction(zone_axis, za_alpha_tilt, za_beta_tilt,
                         reference_pole, rotation):
-    a0, b0 = stage_coordinates([1, 0, 0], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
-    a1, b1 = stage_coordinates([0, 1, 0], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
-    a2, b2 = stage_coordinates([0, 0, 1], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
-
-    #print(a0, b0, a1, b1, a2, b2)
-    direction = [np.cos(np.deg2rad(a0)) * np.cos(np.deg2rad(b0)),
-                 np.cos(np.deg2rad(a1)) * np.cos(np.deg2rad(b1)),
-                 np.cos(np.deg2rad(a2)) * np.cos(np.deg2rad(b2))]
-
-    alpha_tilt_direction = [-1*np.cos(np.deg2rad(a0)) * np.sin(np.deg2rad(b0)),
-                            -1*np.cos(np.deg2rad(a1)) * np.sin(np.deg2rad(b1)),
-                            -1*np.cos(np.deg2rad(a2)) * np.sin(np.deg2rad(b2))]
+    orientation = orientation_matrix(zone_axis, za_alpha_tilt, za_beta_tilt,
+                                     reference_pole, rotation)
+    # the beam at zero tilt is the stage z axis
+    return _scale_to_smallest(orientation[2])
 
+
+def _scale_to_smallest(direction):
+    # Scale a direction so its smallest significant component is +/-1.
     direction = [round(i, 2) for i in direction]
     dmin = min(np.abs(x) for x in direction if np.abs(x) > 0.1)
-    direction = [direction[0] / dmin, direction[1] / dmin, direction[2] / dmin]
-
-
-    # alpha_tilt_direction = [round(i, 2) for i in alpha_tilt_direction]
-    # dmin = min(np.abs(x) for x in alpha_tilt_direction if np.abs(x) > 0.1)
-    # alpha_tilt_direction = [alpha_tilt_direction[0] / dmin,
-    #                         alpha_tilt_direction[1] / dmin,
-    #                         alpha_tilt_direction[2] / dmin]
-    #
-    # print(direction_given_tilt(0,-90,zone_axis,za_alpha_tilt,za_beta_tilt,
-    #       reference_pole, rotation))
-    # print(direction_given_tilt(0, 270, zone_axis, za_alpha_tilt, za_beta_tilt,
-    #                            reference_pole, rotation))
-    #
-    # print(direction, alpha_tilt_direction, a0,b0,a1,b1,a2,b2)
-    return direction
+    return [direction[0] / dmin, direction[1] / dmin, direction[2] / dmin]
+
 
 def direction_given_tilt(alpha, beta, zone_axis, za_alpha_tilt, za_beta_tilt,
                          reference_pole, rotation):
-    a0, b0 = stage_coordinates([1, 0, 0], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
-    a1, b1 = stage_coordinates([0, 1, 0], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
-    a2, b2 = stage_coordinates([0, 0, 1], zone_axis, za_alpha_tilt,
-                               za_beta_tilt, reference_pole, rotation)
+    return list(directions_given_tilts(alpha, beta, zone_axis, za_alpha_tilt,
+                                       za_beta_tilt, reference_pole, rotation))
 
-    u = (np.sin(np.deg2rad(a0))*np.sin(np.deg2rad(alpha)) +
-         np.cos(np.deg2rad(a0))*np.cos(np.deg2rad(alpha))*
-         np.cos(np.deg2rad(beta)-np.deg2rad(b0)))
-    v = (np.sin(np.deg2rad(a1)) * np.sin(np.deg2rad(alpha)) +
-         np.cos(np.deg2rad(a1)) * np.cos(np.deg2rad(alpha)) *
-         np.cos(np.deg2rad(beta) - np.deg2rad(b1)))
-    w = (np.sin(np.deg2rad(a2)) * np.sin(np.deg2rad(alpha)) +
-         np.cos(np.deg2rad(a2)) * np.cos(np.deg2rad(alpha)) *
-         np.cos(np.deg2rad(beta) - np.deg2rad(b2)))
 
-    return([u,v,w])
+@instrument
+def directions_given_tilts(alpha, beta, zone_axis, za_alpha_tilt,
+                           za_beta_tilt, reference_pole, rotation):
+    """
+    Cartesian directions along the beam for many stage positions.
+    The orientation is built once and every (alpha, beta) pair is mapped
+    with a single matrix product.
+    :param alpha: alpha tilt(s) (degrees), any shape broadcastable with beta.
+    :param beta: beta tilt(s) (degrees)
+    :return: (...,3) array of unit vectors in the crystal cartesian frame.
+    """
+    orientation = orientation_matrix(zone_axis, za_alpha_tilt, za_beta_tilt,
+                                     reference_pole, rotation)
+    return stage_vectors(alpha, beta) @ orientation
+
+
+def tilt_grid(xlim=45, ylim=45, step_size=0.1):
+    """
+    Regular grid of stage positions.
+    :return: alpha, beta = (ny,nx) arrays of tilts (degrees)
+    """
+    alpha = np.arange(-xlim, xlim + step_size / 2, step_size)
+    beta = np.arange(-ylim, ylim + step_size / 2, step_size)
+    return np.meshgrid(alpha, beta)
 
 
 
@@ -461,24 +878,88 @@ def _test_pole_plotting(zero_tilt_beam_direction = [1,1,0],
 
 
 def string_direction_to_int(direction):
-    out = []
-    for i in range(len(direction)):
-        if direction[i] == '-':
-            i = i + 1
-            out.append(-1*int(direction[i]))
-        else:
-            out.append(-1 * int(direction[i]))
+    """
+    Indices of a direction written as in markers.json keys.
+    Single digit indices may be run together with minus signs, e.g. '1-10'
+    or '2-1-10'; otherwise they are separated by spaces or commas, e.g.
+    '1 0 -12'. Enclosing brackets are ignored.
+    :param direction: string of three Miller or four Miller-Bravais indices.
+    :return: list of ints.
+    """
+    text = direction.strip().strip('[]<>(){}').replace(',', ' ')
+    if ' ' in text.strip():
+        tokens = text.split()
+    else:
+        tokens = re.findall(r'-?\d', text)
+        if ''.join(tokens) != text:
+            raise ValueError('Invalid direction: %r' % direction)
+    try:
+        out = [int(token) for token in tokens]
+    except ValueError:
+        raise ValueError('Invalid direction: %r' % direction)
+    if len(out) not in (3, 4):
+        raise ValueError('Direction needs 3 or 4 indices: %r' % direction)
+    if len(out) == 4 and out[0] + out[1] + out[2] != 0:
+        raise ValueError('Miller-Bravais indices need u + v + t = 0: %r'
+                         % direction)
     return out
 
 
 def int_direction_to_bar_string(direction):
-    u = direction[0]
-    u = str(u) if u >= 0 else ''.join((str(-u),'\u0305'))
-    v = direction[1]
-    v = str(v) if v >= 0 else ''.join((str(-v), '\u0305'))
-    w = direction[2]
-    w = str(w) if w >= 0 else ''.join((str(-w), '\u0305'))
-    return ''.join((u,v,w))
+    """
+    Label of a direction with overbars for negative indices, e.g. '11\u03051'.
+    Indices are separated by spaces if any has more than one digit.
+    """
+    indices = [int(i) for i in direction]
+    separator = ' ' if any(abs(i) > 9 for i in indices) else ''
+    return separator.join(str(i) if i >= 0 else ''.join((str(-i), '\u0305'))
+                          for i in indices)
+
+
+def int_direction_to_string(direction):
+    """
+    markers.json key of a direction, read back by string_direction_to_int,
+    e.g. '1-10', or '1 0 12' if any index has more than one digit.
+    """
+    indices = [int(i) for i in direction]
+    separator = ' ' if any(abs(i) > 9 for i in indices) else ''
+    return separator.join(str(i) for i in indices)
+
+
+def _reduce_indices(indices):
+    # divide every row by the gcd of its indices
+    divisor = np.gcd.reduce(indices, axis=-1, keepdims=True)
+    return indices // np.where(divisor == 0, 1, divisor)
+
+
+def three_to_four_index(directions, planes=False):
+    """
+    Miller-Bravais [uvtw] of hexagonal lattice directions [UVW].
+    :param directions: [U,V,W] or (N,3) array of integer indices.
+    :param planes: indices are planes, (hkl) -> (hkil) with i = -(h + k).
+    :return: [u,v,t,w] or (N,4) integer array, reduced to lowest integers.
+    """
+    directions = np.asarray(directions, dtype=int)
+    U, V, W = np.moveaxis(directions, -1, 0)
+    if planes:
+        return np.stack((U, V, -(U + V), W), axis=-1)
+    # u = (2U - V)/3, v = (2V - U)/3, t = -(u + v), w = W, times 3
+    four = np.stack((2 * U - V, 2 * V - U, -(U + V), 3 * W), axis=-1)
+    return _reduce_indices(four)
+
+
+def four_to_three_index(directions, planes=False):
+    """
+    Hexagonal lattice directions [UVW] of Miller-Bravais indices [uvtw].
+    :param directions: [u,v,t,w] or (N,4) array of integer indices.
+    :param planes: indices are planes, (hkil) -> (hkl).
+    :return: [U,V,W] or (N,3) integer array, reduced to lowest integers.
+    """
+    directions = np.asarray(directions, dtype=int)
+    u, v, t, w = np.moveaxis(directions, -1, 0)
+    if planes:
+        return np.stack((u, v, w), axis=-1)
+    return _reduce_indices(np.stack((u - t, v - t, w), axis=-1))
 
 
 def get_V(a,b,c,alpha,beta,gamma):
@@ -529,15 +1010,68 @@ def get_M(a,b,c,alpha,beta,gamma):
 
 
 def get_inv_M(a,b,c,alpha,beta,gamma):
-    return np.linalg.inv(get_M(a,b,c,alpha,beta,gamma))
+    return get_lattice(a, b, c, alpha, beta, gamma).inv_M.copy()
 
 
+@instrument
 def native_to_cartesian(direction,a,b,c,alpha,beta,gamma):
-    return np.matmul(get_M(a,b,c,alpha,beta,gamma), direction)
+    return np.matmul(get_lattice(a, b, c, alpha, beta, gamma).M, direction)
 
 
+@instrument
 def cartesian_to_native(direction,a,b,c,alpha,beta,gamma):
-    return np.matmul(get_inv_M(a, b, c, alpha, beta, gamma), direction)
+    return np.matmul(get_lattice(a, b, c, alpha, beta, gamma).inv_M,
+                     direction)
+
+
+class Lattice:
+    """Direct and reciprocal matrices for one set of lattice parameters.
+
+    Get instances from get_lattice so they are shared. The arrays are read
+    only for that reason.
+    """
+    def __init__(self, a, b, c, alpha, beta, gamma):
+        self.parameters = (a, b, c, alpha, beta, gamma)
+        # columns of M are the a, b, c basis vectors in cartesian
+        self.M = get_M(a, b, c, alpha, beta, gamma)
+        self.inv_M = np.linalg.inv(self.M)
+        # columns of reciprocal are the reciprocal basis vectors (no 2 pi)
+        self.reciprocal = self.inv_M.T
+        self.metric = self.M.T @ self.M
+        self.volume = get_V(a, b, c, alpha, beta, gamma)
+        for matrix in (self.M, self.inv_M, self.reciprocal, self.metric):
+            matrix.setflags(write=False)
+
+    def directions_to_cartesian(self, directions):
+        """[u,v,w] or (N,3) lattice directions to cartesian vectors."""
+        return np.asarray(directions, dtype=float) @ self.M.T
+
+    def planes_to_cartesian(self, planes):
+        """(h,k,l) or (N,3) plane indices to cartesian plane normals."""
+        return np.asarray(planes, dtype=float) @ self.reciprocal.T
+
+    def poles_to_cartesian(self, indices, planes=False):
+        """
+        Cartesian vectors of (N,3) indices that are lattice directions, or
+        plane normals where planes is True.
+        :param planes: bool, or (N,) bool array for a mix of both.
+        """
+        indices = np.asarray(indices, dtype=float)
+        vectors = self.directions_to_cartesian(indices)
+        planes = np.broadcast_to(planes, indices.shape[:-1])
+        if planes.any():
+            vectors[planes] = self.planes_to_cartesian(indices[planes])
+        return vectors
+
+    def cartesian_to_directions(self, vectors):
+        """Cartesian vectors, (3,) or (N,3), to lattice directions."""
+        return np.asarray(vectors, dtype=float) @ self.inv_M.T
+
+
+@functools.lru_cache(maxsize=16)
+def get_lattice(a, b, c, alpha, beta, gamma):
+    """Shared Lattice for the parameters, kept in a small LRU cache."""
+    return Lattice(a, b, c, alpha, beta, gamma)
 
 
 
@@ -547,10 +1081,19 @@ class Crystal:
     """Contains all attributes to describe a crystal and it's orientation.
 
     """
+    # Setting any of these clears the cached orientation matrix.
+    orientation_fields = ('a', 'b', 'c', 'alpha', 'beta', 'gamma',
+                          'beam_direction', 'reference_direction',
+                          'rotation_correction', 'a0', 'b0')
+    _orientation_matrix = None
+    # Setting any of these clears the cached extinction table.
+    extinction_fields = ('centering', 'basis')
+    _extinction_table = None
+
     def __init__(self, name, system, a, b, c, alpha, beta, gamma,
                  beam_direction = [1, 1, 1], rotation_correction = 0,
                  reference_direction = [0,0,1], alpha_direction = [0,0,1],
-                 a0 = 0, b0 = 0):
+                 a0 = 0, b0 = 0, centering = 'P', basis = None):
         self.name = name
         self.system = system
         self.a = a
@@ -569,6 +1112,31 @@ class Crystal:
         self.a0 = a0 #alpha tilt for known pole
         self.b0 = b0 #beta tilt for known pole
 
+        # lattice centering and optional atom basis, see ExtinctionTable
+        self.centering = centering
+        self.basis = basis
+
+    # constructor arguments, saved by to_dict
+    dict_fields = ('name', 'system', 'a', 'b', 'c', 'alpha', 'beta', 'gamma',
+                   'beam_direction', 'rotation_correction',
+                   'reference_direction', 'alpha_direction', 'a0', 'b0',
+                   'centering', 'basis')
+
+    def to_dict(self):
+        """Crystal as a dictionary of JSON serializable values."""
+        d = {field: _to_builtin(getattr(self, field))
+             for field in self.dict_fields}
+        d['known_poles'] = _to_builtin(self.knownPoles)
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        """Crystal from a dictionary made by to_dict."""
+        crystal = cls(**{field: d[field] for field in cls.dict_fields
+                         if field in d})
+        crystal.knownPoles = [list(pole) for pole in d.get('known_poles', [])]
+        return crystal
+
     def add_known_pole(self, u,v,w, x_tilt, y_tilt):
         self.knownPoles.append([u,v,w,x_tilt,y_tilt])
 
@@ -578,6 +1146,154 @@ class Crystal:
     def set_orientation(self):
         pass
 
+    def __setattr__(self, name, value):
+        if name in self.orientation_fields:
+            self.__dict__['_orientation_matrix'] = None
+        if name in self.extinction_fields:
+            self.__dict__['_extinction_table'] = None
+        self.__dict__[name] = value
+
+    @property
+    def lattice(self):
+        """Shared Lattice for this crystal's lattice parameters."""
+        return get_lattice(self.a, self.b, self.c,
+                           self.alpha, self.beta, self.gamma)
+
+    @property
+    def symmetry_key(self):
+        """Key of this crystal's system in SYMMETRY_GENERATORS."""
+        return _symmetry_key(self.system, self.alpha, self.beta, self.gamma)
+
+    @property
+    def symmetry_operators(self):
+        """(K,3,3) proper rotations of the point group in cartesian."""
+        lattice = self.lattice
+        return (lattice.M @ lattice_symmetry_operators(self.symmetry_key) @
+                lattice.inv_M)
+
+    @property
+    def extinction_table(self):
+        """Cached ExtinctionTable of this crystal's centering and basis."""
+        if self._extinction_table is None:
+            self._extinction_table = ExtinctionTable(self.centering,
+                                                     self.basis)
+        return self._extinction_table
+
+    def allowed_reflections(self, planes):
+        """False for (hkl) that are kinematically forbidden."""
+        if self.centering == 'P' and self.basis is None:
+            planes = np.asarray(planes)
+            return np.ones(planes.shape[:-1], dtype=bool)[()]
+        return self.extinction_table.allowed(planes)
+
+    def reflection_orders(self, planes):
+        """
+        Lowest order n for which n(hkl) is not kinematically forbidden, 0
+        if none is, see ExtinctionTable.lowest_orders.
+        """
+        if self.centering == 'P' and self.basis is None:
+            planes = np.asarray(planes)
+            return np.ones(planes.shape[:-1], dtype=int)[()]
+        return self.extinction_table.lowest_orders(planes)
+
+    def angle_table(self, max_index=3, planes=False):
+        """
+        Shared angle_table.AngleTable of the pole families of this
+        crystal's lattice and symmetry.
+        """
+        from angle_table import get_angle_table
+        return get_angle_table(self.lattice, self.symmetry_key, max_index,
+                               planes)
+
+    @property
+    def orientation_matrix(self):
+        """Cached rotation from cartesian crystal directions to the stage."""
+        if self._orientation_matrix is None:
+            lattice = self.lattice
+            self._orientation_matrix = orientation_matrix(
+                lattice.directions_to_cartesian(self.beam_direction),
+                self.a0, self.b0,
+                lattice.directions_to_cartesian(self.reference_direction),
+                self.rotation_correction)
+        return self._orientation_matrix
+
+    @instrument
+    def stage_coordinates(self, directions, planes=False):
+        """
+        Tilts that put lattice directions along the beam.
+        :param directions: [u,v,w] or (N,3) array of lattice directions.
+        :param planes: the indices are planes (hkl) and their normals are
+                       put along the beam. bool or (N,) bool array.
+        :return: [alpha, beta] or (N,2) array of tilts. (degrees)
+        """
+        directions = np.asarray(directions, dtype=float)
+        coordinates = stage_coordinates_from_matrix(
+            self.lattice.poles_to_cartesian(np.atleast_2d(directions),
+                                            planes),
+            self.orientation_matrix, self.b0)
+        return coordinates[0] if directions.ndim == 1 else coordinates
+
+    def pole_vectors(self, directions, planes=False):
+        """
+        Stage directions of the beam that put lattice directions on the
+        zone axis, i.e. stage_vectors of their stage_coordinates.
+        :param directions: (N,3) array of lattice directions.
+        :param planes: as in stage_coordinates.
+        :return: (N,3) array of unit vectors in the stage frame.
+        """
+        vectors = self.lattice.poles_to_cartesian(np.atleast_2d(directions),
+                                                  planes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vectors = vectors / np.linalg.norm(vectors, axis=1)[:, None]
+        return vectors @ self.orientation_matrix.T
+
+    def in_tilt_window(self, directions, xlim=45, ylim=45, planes=False):
+        """
+        Cheap prefilter for directions that can be reached within +/-xlim
+        alpha and +/-ylim beta. Inside that window the beam is never more
+        than arccos(cos(xlim)cos(ylim)) from the zero tilt beam, so this
+        keeps every visible direction and some just outside the window.
+        :param directions: (N,3) array of lattice directions.
+        :param planes: as in stage_coordinates.
+        :return: (N,) boolean array, False for directions outside.
+        """
+        vectors = self.lattice.poles_to_cartesian(np.atleast_2d(directions),
+                                                  planes)
+        if xlim >= 90 or ylim >= 90:
+            return np.ones(len(vectors), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos_beam = (vectors @ self.orientation_matrix[2] /
+                        np.linalg.norm(vectors, axis=1))
+        limit = np.cos(np.deg2rad(xlim)) * np.cos(np.deg2rad(ylim))
+        return cos_beam >= limit - 1e-9
+
+    def zero_tilt_direction(self):
+        """Lattice direction along the beam at zero tilt."""
+        return _scale_to_smallest(self.lattice.cartesian_to_directions(
+            self.orientation_matrix[2]))
+
+    @instrument
+    def direction_given_tilt(self, alpha, beta):
+        """
+        Lattice direction along the beam at the given tilts.
+        :param alpha: alpha tilt(s) (degrees). Arrays (e.g. logged stage
+                      positions or a tilt_grid) broadcast with beta.
+        :param beta: beta tilt(s) (degrees)
+        :return: (...,3) array of lattice directions.
+        """
+        # stage frame -> cartesian -> lattice folded into one 3x3 matrix
+        stage_to_lattice = self.orientation_matrix @ self.lattice.inv_M.T
+        return stage_vectors(alpha, beta) @ stage_to_lattice
+
+    def tilt_map(self, xlim=45, ylim=45, step_size=0.1):
+        """
+        Lattice direction along the beam over a full grid of tilts.
+        :return: alpha, beta, directions = (ny,nx) tilt grids (degrees) and
+                 (ny,nx,3) array of lattice directions.
+        """
+        alpha, beta = tilt_grid(xlim, ylim, step_size)
+        return alpha, beta, self.direction_given_tilt(alpha, beta)
+
 class Sample:
     crystals = []
     rotation = 0
@@ -586,8 +1302,44 @@ class Sample:
     def __init__(self, json=None):
         if json is not None:
             self.load(json)
-    def load(self):
-        pass
+
+    def load(self, path):
+        """
+        Read a sample file written by save.
+        :param path: JSON file with rotation, flipped and a list of crystals.
+        """
+        with open(path, 'r') as fp:
+            d = json.load(fp)
+        self.crystals = [Crystal.from_dict(c) for c in d.get('crystals', [])]
+        self.rotation = d.get('rotation', 0)
+        self.flipped = d.get('flipped', False)
+
+    def to_dict(self):
+        return {'rotation': _to_builtin(self.rotation),
+                'flipped': bool(self.flipped),
+                'crystals': [c.to_dict() for c in self.crystals]}
+
+    def save(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, sort_keys=True, indent=4)
+
+    def crystal(self, name):
+        """First crystal with the given name."""
+        for c in self.crystals:
+            if c.name == name:
+                return c
+        raise KeyError(name)
+
+
+def _to_builtin(value):
+    # numpy scalars and arrays, and tuples, as plain python for json
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
 
 
 
@@ -603,6 +1355,9 @@ def _test_matrix_rotation():
                  [0, 1, 0], 6.3, -20.1)
 
     print(misorientation_matrix(c1,c2))
+    angles, axes = misorientations([c1, c2])
+    print(angles[0, 1])
+    print(axes[0, 1])
 
 if __name__ == '__main__':
     #print(native_to_cartesian((1,1,1), 5.22, 5.27, 5.38, 90,99.46,90))
@@ -1,36 +1,59 @@
+"""
+Families of symmetry equivalent directions.
+
+A family is expanded by applying every operator of the crystal's Laue class
+to its indices in one batched product; repeated directions are removed with
+np.unique rather than list membership tests.
+"""
+import numpy as np
+
+from crystal_math import laue_operators
+
+
+def expand_families(families, operators):
+    """
+    Distinct directions generated by a set of operators from each family.
+    A direction reached from several families belongs to the first one.
+    :param families: (F,3) array of family indices.
+    :param operators: (K,3,3) array of operators on direction indices.
+    :return: directions, family = (N,3) int array in order of family then
+             operator, and (N,) index of the family of every direction.
+    """
+    families = np.asarray(families, dtype=int).reshape(-1, 3)
+    operators = np.asarray(operators, dtype=int)
+    candidates = np.einsum('kij,fj->fki', operators,
+                           families).reshape(-1, 3)
+    _, first = np.unique(candidates, axis=0, return_index=True)
+    first.sort()
+    return candidates[first], first // len(operators)
+
+
+def family_of_directions(families, system):
+    """
+    Equivalent directions of several families in a crystal system.
+    :param families: list of family strings such as '110'.
+    :param system: key of crystal_math.SYMMETRY_GENERATORS.
+    :return: dictionary of family -> list of [u, v, w].
+    """
+    keys = [[int(i) for i in family] for family in families]
+    directions, family = expand_families(keys, laue_operators(system))
+    out = {name: [] for name in families}
+    for index, direction in zip(family.tolist(), directions.tolist()):
+        out[families[index]].append(direction)
+    return out
+
+
 def cubic_family_of_directions():
-    out = {}
     direction_families = ['100', '110', '111', '221', '321']
     direction_families = ['100', '110', '111']
-    for family in direction_families:
-        out[family] = []
-        for u in [int(family[0]), -int(family[0])]:
-            for v in [int(family[1]), -int(family[1])]:
-                for w in [int(family[2]), -int(family[2])]:
-                    directions = [[u,v,w], [u,w,v],
-                                  [v,u,w], [v,w,u],
-                                  [w,u,v], [w,v,u]]
-                    for dir in directions:
-                        if dir not in out[family]:
-                            out[family].append(dir)
-    return out
+    return family_of_directions(direction_families, 'Cubic')
 
 def tetragonal_family_of_directions():
-    out = {}
     direction_families = ['100', '001', '110', '111', '221', '321']
-    for family in direction_families:
-        out[family] = []
-        for u in [int(family[0]), -int(family[0])]:
-            for v in [int(family[1]), -int(family[1])]:
-                for w in [int(family[2]), -int(family[2])]:
-                    directions = [[u,v,w], [v,u,w]]
-                    for dir in directions:
-                        if dir not in out[family]:
-                            out[family].append(dir)
-    return out
+    return family_of_directions(direction_families, 'Tetragonal')
 
 
 if __name__ == '__main__':
     a = tetragonal_family_of_directions()
     print(a['100'])
-    print(a['001'])
\ No newline at end of file
+    print(a['001'])
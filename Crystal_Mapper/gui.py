@@ -6,17 +6,17 @@ import matplotlib
 matplotlib.use('QT5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
-import json
 
 
 from crystal_math import *
 from tilt_series_calculator import TiltSeriesCalculator, TiltSeriesPlot
 from pole_plot import PolePlot
+from profile_store import get_store
 
 class CrystalSelector(QtWidgets.QWidget):
 
     def __init__(self, parent=None, params=None):
-        # params is list [family, a, b, c, alpha, beta, gamma]
+        # params is list [family, a, b, c, alpha, beta, gamma(, centering)]
         super(CrystalSelector, self).__init__(parent)
         self.parent = parent
 
@@ -34,6 +34,19 @@ class CrystalSelector(QtWidgets.QWidget):
         #self.comboCrystalSystem.setMaximumWidth(150)
         # endregion
 
+        # region Combo box to select lattice centering
+        self.labelCentering = QtWidgets.QLabel('Centering:')
+        self.comboCentering = QtWidgets.QComboBox(self)
+        self.centerings = {'P (primitive)': 'P',
+                           'I (body centered)': 'I',
+                           'F (face centered)': 'F',
+                           'A (base centered)': 'A',
+                           'B (base centered)': 'B',
+                           'C (base centered)': 'C',
+                           'R (rhombohedral, hexagonal axes)': 'R'}
+        [self.comboCentering.addItem(c) for c in self.centerings]
+        # endregion
+
         # region lattice parameters
         self.labelA = QtWidgets.QLabel('a:')
         self.labelB = QtWidgets.QLabel('b:')
@@ -86,6 +99,9 @@ class CrystalSelector(QtWidgets.QWidget):
         grid.addWidget(self.labelGamma, 2, 4)
         grid.addWidget(self.textGamma, 2, 5)
 
+        grid.addWidget(self.labelCentering, 3, 0, 1, 2)
+        grid.addWidget(self.comboCentering, 3, 2, 1, -1)
+
         self.setLayout(grid)
         # endregion
 
@@ -171,6 +187,13 @@ class CrystalSelector(QtWidgets.QWidget):
         self.textBeta.setText(str(params[5]))
         self.textGamma.setText(str(params[6]))
         self.crystal_select(params[0])
+        if len(params) > 7:
+            for text, centering in self.centerings.items():
+                if centering == params[7]:
+                    self.comboCentering.setCurrentText(text)
+
+    def centering(self):
+        return self.centerings[self.comboCentering.currentText()]
 
 
 class CrystalSelectorDialog(QtWidgets.QDialog):
@@ -197,7 +220,8 @@ class CrystalSelectorDialog(QtWidgets.QDialog):
         else:
             params = [crystal.system,
                       crystal.a, crystal.b, crystal.c,
-                      crystal.alpha, crystal.beta, crystal.gamma]
+                      crystal.alpha, crystal.beta, crystal.gamma,
+                      crystal.centering]
             self.textName.setText(crystal.name)
 
         # endregion
@@ -243,6 +267,7 @@ class CrystalSelectorDialog(QtWidgets.QDialog):
             self.crystal.alpha = float(self.crystal_selector.textAlpha.text())
             self.crystal.beta = float(self.crystal_selector.textBeta.text())
             self.crystal.gamma = float(self.crystal_selector.textGamma.text())
+            self.crystal.centering = self.crystal_selector.centering()
 
         else:
             self.crystal = Crystal(self.textName.text(),
@@ -256,7 +281,8 @@ class CrystalSelectorDialog(QtWidgets.QDialog):
                                    float(
                                        self.crystal_selector.textBeta.text()),
                                    float(
-                                       self.crystal_selector.textGamma.text()))
+                                       self.crystal_selector.textGamma.text()),
+                                   centering=self.crystal_selector.centering())
         if all_good:
             self.done(1)
             return self.crystal
@@ -271,6 +297,7 @@ class MainWindow(QtWidgets.QMainWindow):
         QtWidgets.QMainWindow.__init__(self)
         self.setWindowIcon(QtGui.QIcon('icon.png'))
         self.sample = Sample
+        self.pole_type = None # None follows the profile
 
         # region GUI elements
         self.init_menubar()
@@ -340,6 +367,23 @@ class MainWindow(QtWidgets.QMainWindow):
         selectPoleProfileButton.triggered.connect(self.select_pole_profile)
         optionsMenu.addAction(selectPoleProfileButton)
 
+        poleTypeMenu = optionsMenu.addMenu('Plot poles as')
+        poleTypeGroup = QtWidgets.QActionGroup(self)
+        for text, pole_type in (('As in profile', None),
+                                ('Directions [uvw]', 'direction'),
+                                ('Plane normals (hkl)', 'plane')):
+            action = QtWidgets.QAction(text, self, checkable=True)
+            action.setChecked(pole_type is None)
+            action.triggered.connect(
+                lambda checked, pole_type=pole_type:
+                self.set_pole_type(pole_type))
+            poleTypeGroup.addAction(action)
+            poleTypeMenu.addAction(action)
+
+    def set_pole_type(self, pole_type):
+        self.pole_type = pole_type
+        self.update_all()
+
     def set_params(self):
         try:
             idx = self.listWidgetCrystals.currentRow()
@@ -419,7 +463,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.update_crystal_info_label(
                 self.sample.crystals[self.listWidgetCrystals.currentRow()])
             self.plotCanvas.plot(
-                self.sample.crystals[self.listWidgetCrystals.currentRow()])
+                self.sample.crystals[self.listWidgetCrystals.currentRow()],
+                poles=self.pole_type)
             #self.plotCanvas.crystal = self.sample.crystals[
                 #self.listWidgetCrystals.currentRow()]
         except IndexError: # no crystals
@@ -572,6 +617,8 @@ class EditPolesDialog(QtWidgets.QDialog):
         self.comboSize = QtWidgets.QComboBox()
         self.labColor = QtWidgets.QLabel('Marker color:')
         self.butColor = QtWidgets.QPushButton("Color")
+        self.labPoleType = QtWidgets.QLabel('Pole type:')
+        self.comboPoleType = QtWidgets.QComboBox()
         self.butOk = QtWidgets.QPushButton('Ok')
         self.butCancel = QtWidgets.QPushButton('Cancel')
 
@@ -584,6 +631,7 @@ class EditPolesDialog(QtWidgets.QDialog):
         self.listPoles.selectionModel().selectionChanged.connect(self.listPoles_selectionChanged)
         self.comboSize.currentTextChanged.connect(self.comboSize_changed)
         self.comboType.currentTextChanged.connect(self.comboType_changed)
+        self.comboPoleType.currentTextChanged.connect(self.comboPoleType_changed)
 
         # Poplulate lists
         self.change_nothing = True
@@ -601,6 +649,9 @@ class EditPolesDialog(QtWidgets.QDialog):
                              'hexagon hor': 'H',
                              'plus': 'P'}
         [self.comboType.addItem(this_mt) for this_mt in self.marker_types]
+        self.pole_types = {'direction [uvw]': 'direction',
+                           'plane normal (hkl)': 'plane'}
+        [self.comboPoleType.addItem(this_pt) for this_pt in self.pole_types]
 
         self.colors = [[238,238,238],
                        [239,154,154],
@@ -651,6 +702,8 @@ class EditPolesDialog(QtWidgets.QDialog):
         optionsLayout.addWidget(self.comboSize)
         optionsLayout.addWidget(self.labColor)
         optionsLayout.addWidget(self.butColor)
+        optionsLayout.addWidget(self.labPoleType)
+        optionsLayout.addWidget(self.comboPoleType)
         optionsLayout.addStretch()
 
         self.setLayout(topLayout)
@@ -677,6 +730,14 @@ class EditPolesDialog(QtWidgets.QDialog):
             for item in self.listPoles.selectedItems():
                 self.temp_profile_dict[item.text()]['marker'] = self.marker_types[mt]
 
+    def comboPoleType_changed(self, pt):
+        if not self.change_nothing:
+            for item in self.listPoles.selectedItems():
+                if self.pole_types[pt] == 'plane':
+                    self.temp_profile_dict[item.text()]['type'] = 'plane'
+                else:
+                    self.temp_profile_dict[item.text()].pop('type', None)
+
     def butColor_clicked(self):
         color = QtWidgets.QColorDialog.getColor()
         if color.isValid():
@@ -699,20 +760,19 @@ class EditPolesDialog(QtWidgets.QDialog):
 
     def butAdd_clicked(self):
         text, okPressed = QtWidgets.QInputDialog.getText(
-            self, "Add poles", "Type poles to add. Separate with comma:", QtWidgets.QLineEdit.Normal, "")
+            self, "Add poles", "Type poles to add, e.g. 112, 1-10, 2-1-10 or 1 0 12. Separate with comma:",
+            QtWidgets.QLineEdit.Normal, "")
         if okPressed and text != '':
             problems = False
             for t in text.split(','):
-                if len(t) == 3:
-                    try:
-                        _ = int(t)
-                        pole_list = [self.listPoles.item(i).text() for i in range(self.listPoles.count())]
-                        if t not in pole_list:
-                            self.listPoles.addItem(t)
-                            self.temp_profile_dict[t] = {"color": [189,189,189],"marker": "o","ms": 15}
-                    except ValueError:
-                        problems = True
-                else:
+                t = t.strip()
+                try:
+                    _ = string_direction_to_int(t)
+                    pole_list = [self.listPoles.item(i).text() for i in range(self.listPoles.count())]
+                    if t not in pole_list:
+                        self.listPoles.addItem(t)
+                        self.temp_profile_dict[t] = {"color": [189,189,189],"marker": "o","ms": 15}
+                except ValueError:
                     problems = True
             if problems:
                 msg = QtWidgets.QMessageBox.information(self, 'Invalid pole',
@@ -730,8 +790,8 @@ class SelectPolesDialog(QtWidgets.QDialog):
         super(SelectPolesDialog, self).__init__(parent)
         self.setWindowTitle("Select pole plot profile")
 
-        with open('data/markers.json', 'r') as fp:
-            self.markerdict = json.load(fp)
+        self.store = get_store()
+        self.markerdict = self.store.data()
 
         self.changed = False
 
@@ -829,9 +889,11 @@ class SelectPolesDialog(QtWidgets.QDialog):
 
     def butOk_clicked(self):
         selection = self.listProfiles.currentItem().text()
-        self.markerdict['Current'] = selection
-        with open('data/markers.json', 'w') as fp:
-            json.dump(self.markerdict, fp, sort_keys=True, indent=4)
+        saved = self.store.data()
+        changed = {name: profile for name, profile in self.markerdict.items()
+                   if name != 'Current' and saved.get(name) != profile}
+        deleted = [name for name in saved if name not in self.markerdict]
+        self.store.update(changed, deleted, current=selection)
         self.accept()
 
     def butCancel_clicked(self):
@@ -0,0 +1,266 @@
+"""
+Hover annotations for scatter plots answered from a spatial index.
+
+Rather than calling contains() on every collection for each mouse move, the
+plotted points are binned once into a uniform grid in display coordinates
+and every motion event is a lookup in the few cells around the cursor. The
+annotation is blitted over a cached background rather than redrawing the
+figure.
+"""
+import numpy as np
+
+
+class PointIndex:
+    """
+    Uniform grid over 2D points with a hit radius per point.
+    :param points: (N,2) array of display coordinates (pixels). Points that
+                   are not finite are never found.
+    :param radii: hit radius (pixels) of every point, scalar or (N,).
+    :param priority: optional (N,) ranks; among several hits the lowest rank
+                     wins before distance is considered.
+    """
+
+    def __init__(self, points, radii, priority=None):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float),
+                                (len(points),))
+        finite = np.isfinite(points).all(axis=1)
+        self.ids = np.flatnonzero(finite)
+        self.points = points[finite]
+        self.radii = radii[finite]
+        if priority is None:
+            priority = np.zeros(len(points))
+        self.priority = np.asarray(priority)[finite]
+        # a hit is never more than one cell away from the cursor's cell
+        self.cell_size = max(2 * self.radii.max(initial=0), 1.0)
+
+        cells = np.floor(self.points / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        keys, starts = np.unique(cells[order], axis=0, return_index=True)
+        ends = np.append(starts[1:], len(order))
+        self._cells = {(i, j): order[start:end] for (i, j), start, end in
+                       zip(keys.tolist(), starts, ends)}
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, x, y):
+        """
+        Nearest point of the best priority whose hit radius contains (x, y).
+        :return: index into the original points, or None.
+        """
+        i = int(np.floor(x / self.cell_size))
+        j = int(np.floor(y / self.cell_size))
+        candidates = [self._cells[(i + di, j + dj)]
+                      for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                      if (i + di, j + dj) in self._cells]
+        if not candidates:
+            return None
+        candidates = np.concatenate(candidates)
+        distance = np.hypot(self.points[candidates, 0] - x,
+                            self.points[candidates, 1] - y)
+        hits = distance <= self.radii[candidates]
+        if not hits.any():
+            return None
+        candidates = candidates[hits]
+        best = np.lexsort((distance[hits], self.priority[candidates]))[0]
+        return self.ids[candidates[best]]
+
+
+class BlitManager:
+    """
+    Redraws animated artists over a cached background instead of redrawing
+    the whole figure. The background is copied after every full draw, which
+    still happens on resize or when the plotted data changes; update() falls
+    back to a full draw while there is no usable background.
+    """
+
+    def __init__(self, canvas, artists=()):
+        self.canvas = canvas
+        self.artists = []
+        self._background = None
+        self._size = None
+        for artist in artists:
+            self.add_artist(artist)
+        self._cid = canvas.mpl_connect('draw_event', self._drawn)
+
+    def add_artist(self, artist):
+        """Take an artist out of full draws and draw it in update()."""
+        artist.set_animated(True)
+        self.artists.append(artist)
+
+    def remove_artist(self, artist):
+        if artist in self.artists:
+            self.artists.remove(artist)
+            artist.set_animated(False)
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self._cid)
+
+    def _drawn(self, event):
+        figure = self.canvas.figure
+        if getattr(self.canvas, 'supports_blit', False):
+            self._background = self.canvas.copy_from_bbox(figure.bbox)
+            self._size = self.canvas.get_width_height()
+        self._draw_artists()
+
+    def _draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            if artist.figure is figure:
+                figure.draw_artist(artist)
+
+    def update(self):
+        """Show the current state of the animated artists."""
+        if (self._background is None or
+                self._size != self.canvas.get_width_height()):
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+class HoverAnnotation:
+    """
+    Shows an annotation for the plotted point under the cursor.
+
+    Layers are (collection, labels, colors) tuples. labels is one string
+    for the whole collection or one string per point; colors is one colour
+    or an (M,3)/(M,4) array of colours per point. The index is rebuilt when
+    the layers change (call invalidate() after updating offsets) or when a
+    draw changes the data to display transform, e.g. on resize.
+
+    :param canvas: FigureCanvas to connect to.
+    :param ax: axes holding the collections.
+    :param annot: matplotlib Annotation used to display the text.
+    :param decimals: round the displayed tilts, None to show them as is.
+    :param tolerance: minimum hit radius in pixels.
+    :param blit_manager: BlitManager shared with other overlays of the
+                         canvas, a new one if None.
+    """
+
+    def __init__(self, canvas, ax, annot=None, decimals=None, tolerance=3,
+                 blit_manager=None):
+        self.canvas = canvas
+        self.ax = ax
+        self._own_blit_manager = blit_manager is None
+        if blit_manager is None:
+            blit_manager = BlitManager(canvas)
+        self.blit_manager = blit_manager
+        self._annot = None
+        self.annot = annot
+        self.decimals = decimals
+        self.tolerance = tolerance
+        self.layers = []
+        self.index = None
+        self._lookup = None
+        self._transform = None
+        self._cids = [canvas.mpl_connect('motion_notify_event', self.hover),
+                      canvas.mpl_connect('draw_event', self._drawn)]
+
+    @property
+    def annot(self):
+        return self._annot
+
+    @annot.setter
+    def annot(self, annot):
+        # the annotation is blitted, so it is left out of full draws
+        if self._annot is not None:
+            self.blit_manager.remove_artist(self._annot)
+        self._annot = annot
+        if annot is not None:
+            self.blit_manager.add_artist(annot)
+
+    def disconnect(self):
+        for cid in self._cids:
+            self.canvas.mpl_disconnect(cid)
+        self._cids = []
+        self.annot = None
+        if self._own_blit_manager:
+            self.blit_manager.disconnect()
+
+    def set_layers(self, layers):
+        self.layers = list(layers)
+        self.invalidate()
+
+    def invalidate(self):
+        self.index = None
+
+    def _drawn(self, event):
+        transform = self.ax.transData.get_affine().get_matrix()
+        if self._transform is None or not np.array_equal(transform,
+                                                         self._transform):
+            self.invalidate()
+
+    def _build(self):
+        points = []
+        radii = []
+        lookup = []
+        scale = self.canvas.figure.dpi / 72
+        for layer, (sc, labels, colors) in enumerate(self.layers):
+            if not sc.get_visible():
+                continue
+            offsets = np.asarray(sc.get_offsets(), dtype=float).reshape(-1, 2)
+            if len(offsets) == 0:
+                continue
+            points.append(self.ax.transData.transform(offsets))
+            sizes = sc.get_sizes()
+            if len(sizes) == 0:
+                sizes = np.array([36.0])
+            sizes = np.resize(sizes, len(offsets))
+            radii.append(np.maximum(np.sqrt(sizes) / 2 * scale,
+                                    self.tolerance))
+            lookup.append(np.column_stack(
+                (np.full(len(offsets), layer), np.arange(len(offsets)))))
+        if points:
+            # earlier layers win, like the order of contains() tests did
+            self._lookup = np.concatenate(lookup)
+            self.index = PointIndex(np.concatenate(points),
+                                    np.concatenate(radii),
+                                    priority=self._lookup[:, 0])
+        else:
+            self.index = PointIndex(np.empty((0, 2)), 0)
+            self._lookup = np.empty((0, 2), dtype=int)
+        self._transform = self.ax.transData.get_affine().get_matrix().copy()
+
+    def find(self, x, y):
+        """
+        Point under display coordinates (x, y).
+        :return: (layer index, point index) or None.
+        """
+        if self.index is None:
+            self._build()
+        found = self.index.query(x, y)
+        if found is None:
+            return None
+        layer, point = self._lookup[found]
+        return int(layer), int(point)
+
+    def text(self, label, pos):
+        x, y = pos
+        if self.decimals is not None:
+            x, y = round(x, self.decimals), round(y, self.decimals)
+        return ''.join((label, '\nX tilt = ', str(x), ', Y tilt = ', str(y)))
+
+    def hover(self, event):
+        annot = self.annot
+        if annot is None or event.inaxes != self.ax:
+            return
+        vis = annot.get_visible()
+        found = self.find(event.x, event.y)
+        if found is not None:
+            layer, point = found
+            sc, labels, colors = self.layers[layer]
+            pos = sc.get_offsets()[point]
+            label = labels if isinstance(labels, str) else labels[point]
+            color = colors[point] if np.ndim(colors) == 2 else colors
+            annot.xy = pos
+            annot.set_text(self.text(label, pos))
+            annot.get_bbox_patch().set_facecolor(color)
+            annot.get_bbox_patch().set_alpha(0.8)
+            annot.set_visible(True)
+            self.blit_manager.update()
+        elif vis:
+            annot.set_visible(False)
+            self.blit_manager.update()
@@ -0,0 +1,155 @@
+"""
+Opt-in timing of the crystal_math kernels and the plotting phases.
+
+Kernels are registered with the @instrument decorator and returned
+untouched, so nothing is added to a call while instrumentation is off.
+enable() swaps timed wrappers into every loaded module namespace and class
+that holds a registered function (including copies made by
+``from crystal_math import *``) and disable() swaps the originals back.
+
+Set CRYSTAL_MAPPER_INSTRUMENT=1 to enable at start up, or to a path ending
+in .json to also write the statistics there when the program exits.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ENVIRONMENT_VARIABLE = 'CRYSTAL_MAPPER_INSTRUMENT'
+
+_enabled = False
+_registry = {}  # id(original function) -> (original, name)
+_wrappers = {}  # id(original function) -> timed wrapper
+_stats = {}
+_null_phase = contextlib.nullcontext()
+
+
+def is_enabled():
+    return _enabled
+
+
+def instrument(func=None, name=None):
+    """
+    Register a function as an instrumented kernel.
+    :param name: name used in the statistics, defaults to the qualified name.
+    """
+    def register(func):
+        _registry[id(func)] = (func, name or func.__qualname__)
+        if _enabled:
+            return _wrapper(func)
+        return func
+    if func is None:
+        return register
+    return register(func)
+
+
+def _wrapper(func):
+    if id(func) not in _wrappers:
+        name = _registry[id(func)][1]
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start,
+                        sum(np.size(a) for a in args
+                            if isinstance(a, np.ndarray)))
+        _wrappers[id(func)] = timed
+    return _wrappers[id(func)]
+
+
+def _record(name, elapsed, elements=0):
+    stat = _stats.setdefault(name, {'calls': 0, 'total_time': 0.0,
+                                    'max_time': 0.0, 'elements': 0})
+    stat['calls'] += 1
+    stat['total_time'] += elapsed
+    stat['max_time'] = max(stat['max_time'], elapsed)
+    stat['elements'] += int(elements)
+
+
+def _swap(replacements):
+    # Replace functions by id in every module namespace and in the classes
+    # those modules define.
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, '__dict__', None)
+        if not isinstance(namespace, dict):
+            continue
+        for key, value in list(namespace.items()):
+            if id(value) in replacements:
+                namespace[key] = replacements[id(value)]
+            elif (isinstance(value, type) and
+                  value.__module__ == module.__name__):
+                for attribute, member in list(vars(value).items()):
+                    if id(member) in replacements:
+                        setattr(value, attribute, replacements[id(member)])
+
+
+def enable():
+    """Start recording. Registered kernels are replaced by timed wrappers."""
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    _swap({key: _wrapper(func) for key, (func, _) in _registry.items()})
+
+
+def disable():
+    """Stop recording and restore the original kernels."""
+    global _enabled
+    if not _enabled:
+        return
+    _enabled = False
+    _swap({id(_wrappers[key]): func for key, (func, _) in _registry.items()
+           if key in _wrappers})
+
+
+def reset():
+    _stats.clear()
+
+
+def phase(name):
+    """
+    Context manager timing a block, e.g. one phase of PolePlot.plot.
+    Returns a shared no-op context while disabled.
+    """
+    if not _enabled:
+        return _null_phase
+    return _timed_phase(name)
+
+
+@contextlib.contextmanager
+def _timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def stats():
+    """Copy of the statistics keyed by kernel or phase name."""
+    return {name: dict(stat) for name, stat in _stats.items()}
+
+
+def export_json(path=None):
+    """
+    Statistics as a JSON string, also written to path if given.
+    """
+    text = json.dumps(stats(), indent=2, sort_keys=True)
+    if path is not None:
+        with open(path, 'w') as fp:
+            fp.write(text)
+    return text
+
+
+if os.environ.get(ENVIRONMENT_VARIABLE, '') not in ('', '0'):
+    enable()
+    if os.environ[ENVIRONMENT_VARIABLE].endswith('.json'):
+        atexit.register(export_json, os.environ[ENVIRONMENT_VARIABLE])
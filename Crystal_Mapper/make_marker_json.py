@@ -1,34 +1,69 @@
+"""
+Generate the default pole marker profile.
+
+    python make_marker_json.py --max-index 12 --min-angle 2
+
+Families are the non-negative index triples reduced by their gcd, so every
+family appears once without comparing it against the others.
+"""
+import argparse
+import os
+
 import numpy as np
-import json
-
-#make_directions_familes
-direction_families = []
-for i in range(8):
-    for j in range(8):
-        for k in range(8):
-            if i + j + k < 10:
-                if ([i/2, j/2, k/2] not in direction_families and
-                    [i/3, j/3, k/3] not in direction_families and
-                    [i/4, j/4, k/4] not in direction_families and
-                    [i/5, j/5, k/5] not in direction_families and
-                    [i/6, j/6, k/6] not in direction_families and
-                    [i/7, j/7, k/7] not in direction_families and
-                    [i/8, j/8, k/8] not in direction_families):
-
-                        direction_families.append([i,j,k])
-
-dictionary = {}
-
-# use this for after reading the json
-##for i,j,k in direction_families.copy():
-##    for u in (-1, 1):
-##        for v in (-1, 1):
-##            for w in (-1, 1):
-##                 pass
-##                #put all negatives in
-
-for i,j,k in direction_families:
-    name = ''.join((str(i),str(j),str(k)))
+
+from crystal_math import get_lattice, int_direction_to_string
+from profile_store import DEFAULT_PATH, get_store
+
+
+def direction_families(max_index=7, max_sum=9, min_angle=None,
+                       lattice=None, block=256):
+    """
+    Reduced direction families, lowest indices first within each sum.
+    :param max_index: largest index.
+    :param max_sum: largest sum of the indices, None for no limit.
+    :param min_angle: drop families closer than this (degrees) to a family
+                      with a lower index sum, None to keep all.
+    :param lattice: Lattice giving the angles for min_angle, cubic if None.
+    :param block: families compared per matrix product for min_angle.
+    :return: (F,3) int array.
+    """
+    indices = np.arange(max_index + 1)
+    families = np.stack(np.meshgrid(indices, indices, indices,
+                                    indexing='ij'), axis=-1).reshape(-1, 3)
+    if max_sum is not None:
+        families = families[families.sum(axis=1) <= max_sum]
+    # a triple is its own family only if it can not be divided further,
+    # which also drops [0, 0, 0]
+    families = families[np.gcd.reduce(families, axis=1) == 1]
+    if min_angle is None:
+        return families
+
+    families = families[np.argsort(families.sum(axis=1), kind='stable')]
+    if lattice is None:
+        lattice = get_lattice(1, 1, 1, 90, 90, 90)
+    vectors = lattice.directions_to_cartesian(families)
+    vectors /= np.linalg.norm(vectors, axis=1)[:, None]
+    # a block of families is compared at once with every family kept
+    # before it, then the survivors are thinned among themselves in order
+    limit = np.cos(np.radians(min_angle))
+    keep = np.ones(len(families), dtype=bool)
+    for start in range(0, len(families), block):
+        rows = np.arange(start, min(start + block, len(families)))
+        kept = vectors[:start][keep[:start]]
+        rows = rows[~(vectors[rows] @ kept.T > limit).any(axis=1)]
+        keep[start:start + block] = False
+        near = np.triu(vectors[rows] @ vectors[rows].T > limit, 1)
+        inside = np.ones(len(rows), dtype=bool)
+        for i in np.flatnonzero(near.any(axis=1)):
+            if inside[i]:
+                inside[near[i]] = False
+        keep[rows[inside]] = True
+    return families[keep]
+
+
+def family_style(direction):
+    """Marker of a family: low index families stand out, the rest shrink."""
+    i, j, k = direction
     if i + j + k == 1:
         color = (239,154,154)
         ms = 100
@@ -47,21 +82,47 @@ for i,j,k in direction_families:
         marker = 'o'
     else:
         color = (189,189,189)
-        ms = 50 - (i+j+k) * 5
+        ms = max(50 - (i+j+k) * 5, 5)
         marker = 'o'
-        
-    dictionary[name] = {'color':color,
-                        'ms':ms,
-                        'marker':marker}
+    return {'color': list(color), 'ms': ms, 'marker': marker}
+
+
+def make_profile(families):
+    """Marker profile of families, keyed as in markers.json."""
+    return {int_direction_to_string(family): family_style(family)
+            for family in np.asarray(families).tolist()}
+
+
+def write_profile(profile, name='Default', path=DEFAULT_PATH, current=True):
+    """
+    Save a profile through the profile store, keeping the other profiles.
+    :param current: make it the current profile.
+    """
+    store = get_store(path)
+    if os.path.exists(path):
+        store.update({name: profile}, current=name if current else None)
+    else:
+        store.save_all({'Current': name, name: profile})
 
 
-whole_dic = {}
-whole_dic['Current'] = 'Default'
-whole_dic['Default'] = dictionary
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate a pole marker profile.')
+    parser.add_argument('--max-index', type=int, default=7)
+    parser.add_argument('--max-sum', type=int, default=9,
+                        help='largest index sum, 0 for no limit')
+    parser.add_argument('--min-angle', type=float, default=None,
+                        help='smallest angle between families (degrees)')
+    parser.add_argument('--name', default='Default', help='profile name')
+    parser.add_argument('--path', default=DEFAULT_PATH,
+                        help='marker profile file')
+    args = parser.parse_args(argv)
 
+    families = direction_families(args.max_index, args.max_sum or None,
+                                  args.min_angle)
+    write_profile(make_profile(families), args.name, args.path)
+    print('%d families written to %s' % (len(families), args.path))
 
-with open('data/markers.json', 'w') as fp:
-    json.dump(whole_dic, fp, sort_keys=True, indent=4)
 
-#with open('data.json', 'r') as fp:
-#    data = json.load(fp)
+if __name__ == '__main__':
+    main()
@@ -4,28 +4,44 @@ import matplotlib
 matplotlib.use('QT5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
-import json
 from crystal_math import *
+from instrumentation import phase
+from profile_store import get_store
+from hover import BlitManager, HoverAnnotation
+from pole_renderer import PoleRenderer
 
 
 class PolePlot(FigureCanvas):
-
-    def __init__(self, parent=None, width=4, height=4, dpi=200):
-        self.fig = matplotlib.figure.Figure()
-        self.ax = self.fig.add_subplot(111)
-        self.ax.axis('off')
-        self.ax.set_aspect('equal', 'box')
-
-        # color
-        self.ax.set_facecolor((0,0,0))
-        self.fig.patch.set_facecolor((0,0,0))
-        self.ax.spines['bottom'].set_color('w')
-        self.ax.spines['top'].set_color('w')
-        self.ax.spines['right'].set_color('w')
-        self.ax.spines['left'].set_color('w')
-        self.ax.tick_params(axis='x', colors='white')
-        self.ax.tick_params(axis='y', colors='white')
-
+    """
+    Qt canvas showing a PoleRenderer pole figure with hover annotations.
+    """
+
+    def __init__(self, parent=None, width=4, height=4, dpi=200,
+                 group_by_marker=True):
+        self.pole_renderer = PoleRenderer(group_by_marker=group_by_marker)
+        self.fig = self.pole_renderer.fig
+        self.ax = self.pole_renderer.ax
+
+        self.annot = self.ax.annotate(
+            "", xy=(0, 0), xytext=(0.3, 0.1),
+            textcoords="figure fraction",
+            bbox=dict(boxstyle="round", fc="w", color='w'),
+            arrowprops=dict(arrowstyle="->", color='w'),
+            horizontalalignment='center',
+            color='black',
+            fontsize=12,
+            fontweight='bold')
+        self.annot.set_visible(False)
+
+        # live stage position, see set_stage_position
+        self.stage_cursor, = self.ax.plot(
+            [], [], marker='+', markersize=20, markeredgewidth=2,
+            color='lime', linestyle='none', visible=False)
+        self.stage_text = self.fig.text(
+            0.02, 0.98, '', color='lime', fontsize=10,
+            verticalalignment='top', visible=False)
+        self.stage_source = None
+        self._stage_timer = None
 
         FigureCanvas.__init__(self, self.fig)
         self.setParent(parent)
@@ -34,174 +50,79 @@ class PolePlot(FigureCanvas):
             QtWidgets.QSizePolicy.Expanding)
         self.updateGeometry()
 
-    def plot(self, crystal, interface_alpha=None, interface_beta=None,
-             interface_rotation=None, xlim=45, ylim=45):
-        ax = self.ax
-        ax.cla()
-        self.fig.tight_layout()
-        self.ax.axis('on')
-
-        fig = self.fig
-        ax.spines['left'].set_position('zero')
-        ax.spines['right'].set_color('none')
-        ax.spines['bottom'].set_position('zero')
-        ax.spines['top'].set_color('none')
-        ax.spines['left'].set_smart_bounds(True)
-        ax.spines['bottom'].set_smart_bounds(True)
-        ax.xaxis.set_ticks_position('bottom')
-        ax.yaxis.set_ticks_position('left')
-
-        self.ax.set_xlim(-1 * xlim, xlim)
-        self.ax.set_ylim(-1 * ylim, ylim)
-
-        scs = []
-        colors = []
-        names = []
-
-        if crystal is not None:
-            beam_direction = crystal.beam_direction
+        # overlays are blitted over the last full draw
+        self.blit_manager = BlitManager(self, (self.stage_cursor,
+                                               self.stage_text))
+        self.hover_annotation = None
+        self.connect_hover()
 
-            # # set reference direction
-            rotation_correction = crystal.rotation_correction
-            reference_direction = crystal.reference_direction
-
-            # convert reference and beam direction to cartesian
-            zero_tilt_beam_direction = native_to_cartesian(
-                beam_direction,
-                crystal.a, crystal.b, crystal.c,
-                crystal.alpha, crystal.beta, crystal.gamma)
-
-            reference_direction = native_to_cartesian(reference_direction,
-                                                      crystal.a, crystal.b,
-                                                      crystal.c,
-                                                      crystal.alpha,
-                                                      crystal.beta,
-                                                      crystal.gamma)
-            # get family of directions
-            with open('data/markers.json', 'r') as fp:
-                ddict = json.load(fp)
-                direction_dict = ddict[ddict['Current']]
-
-            # print(direction_dict['111'])
-
-            for family in direction_dict:
-                # get all directions for family including negatives
-                directions = []
-                directions.append(string_direction_to_int(family))
-                for u in (-1, 1):
-                    for v in (-1, 1):
-                        for w in (-1, 1):
-                            i, j, k = directions[0]
-                            next_direction = [u * i, v * j, w * k]
-                            if next_direction not in directions:
-                                directions.append(next_direction)
-
-
-                this_familys_coordinates = []
-                for direction in directions:
-                    # print('   ', direction)
-                    cartesian_direction = native_to_cartesian(direction,
-                                                              crystal.a, crystal.b,
-                                                              crystal.c,
-                                                              crystal.alpha,
-                                                              crystal.beta,
-                                                              crystal.gamma)
-                    next_coordinates = stage_coordinates(
-                        cartesian_direction, zero_tilt_beam_direction,
-                        crystal.a0, crystal.b0,
-                        reference_direction, rotation_correction)
-
-                    this_familys_coordinates.append(next_coordinates)
-
-                this_familys_x_coordinates = [i[0] for i in
-                                              this_familys_coordinates]
-                this_familys_y_coordinates = [i[1] for i in
-                                              this_familys_coordinates]
-
-                color = (direction_dict[family]['color'][0] / 255,
-                         direction_dict[family]['color'][1] / 255,
-                         direction_dict[family]['color'][2] / 255)
-
-                scs.append(self.ax.scatter(this_familys_x_coordinates,
-                                           this_familys_y_coordinates,
-                                           marker=direction_dict[family]['marker'],
-                                           s=direction_dict[family]['ms'],
-                                           c=np.array([color])))
-                colors.append(color)
-                names.append([int_direction_to_bar_string(d) for d in directions])
-
-        if interface_alpha is not None and interface_beta is not None and interface_rotation is not None:
-            x_coords = []
-            y_coords = []
-            for x, y in along_interface_tilt_coordinates(interface_alpha,
-                                                         interface_beta,
-                                                         interface_rotation,
-                                                         step_size=0.1):
-                x_coords.append(x)
-                y_coords.append(y)
-            scs.append(self.ax.scatter(x_coords, y_coords, color='blue',
-                                       marker='.', s=1))
-            names.append('Along Interface')
-            colors.append('blue')
-
-            x_coords = []
-            y_coords = []
-            for x, y in normal_to_interface_tilt_coordinates(interface_alpha,
-                                                             interface_beta,
-                                                             interface_rotation,
-                                                             step_size=0.1):
-                x_coords.append(x)
-                y_coords.append(y)
-            scs.append(self.ax.scatter(x_coords, y_coords, color='red',
-                                       marker='.', s=1))
-            names.append('Across Interface')
-            colors.append('red')
-
-        annot = ax.annotate("", xy=(0, 0), xytext=(0.3, 0.1),
-                            textcoords="figure fraction",
-                            bbox=dict(boxstyle="round", fc="w", color='w'),
-                            arrowprops=dict(arrowstyle="->", color='w'),
-                            horizontalalignment='center',
-                            color='black',
-                            fontsize=12,
-                            fontweight='bold')
-        annot.set_visible(False)
-
-        def update_annot(sc, ind, color, i):
-
-            pos = sc.get_offsets()[ind["ind"][0]]
-            annot.xy = pos
-            try:
-                text = ''.join(('<', names[i][ind["ind"][0]], '>',
-                                '\nX tilt = ', str(pos[0]),
-                                ', Y tilt = ', str(pos[1])))
-            except:
-                text = ''.join((names[i],
-                                '\nX tilt = ', str(pos[0]),
-                                ', Y tilt = ', str(pos[1])))
-            annot.set_text(text)
-            annot.get_bbox_patch().set_facecolor(color)
-            annot.get_bbox_patch().set_alpha(0.8)
-
-        def hover(event):
-            vis = annot.get_visible()
-            if event.inaxes == ax:
-                for i, sc in enumerate(scs):
-                    cont, ind = sc.contains(event)
-                    if cont:
-                        update_annot(sc, ind, colors[i], i)
-                        annot.set_visible(True)
-                        fig.canvas.draw_idle()
-                        break
-                else:
-                    if vis:
-                        annot.set_visible(False)
-                        fig.canvas.draw_idle()
-
-        fig.canvas.mpl_connect("motion_notify_event", hover)
+    def connect_hover(self):
+        """Connect the hover annotation, replacing any earlier connection."""
+        if self.hover_annotation is not None:
+            self.hover_annotation.disconnect()
+        self.hover_annotation = HoverAnnotation(
+            self, self.ax, self.annot, blit_manager=self.blit_manager)
+        self.hover_annotation.set_layers(self.pole_renderer.hover_layers())
 
+    def plot(self, crystal, interface_alpha=None, interface_beta=None,
+             interface_rotation=None, xlim=45, ylim=45, poles=None):
+        self.pole_renderer.plot(crystal, interface_alpha, interface_beta,
+                                interface_rotation, xlim, ylim, poles=poles)
+        self.annot.set_visible(False)
+        self.hover_annotation.set_layers(self.pole_renderer.hover_layers())
         self.draw_idle()
 
+    def set_stage_position(self, alpha, beta):
+        """
+        Move the stage cursor and show the nearest plotted pole. Only the
+        cursor is redrawn, so this can be called at the stage read-out rate.
+        """
+        self.stage_cursor.set_data([alpha], [beta])
+        self.stage_cursor.set_visible(True)
+        text = 'Stage: X tilt = %.1f, Y tilt = %.1f' % (alpha, beta)
+        nearest = self.pole_renderer.nearest_pole(alpha, beta)
+        if nearest is not None:
+            label, angle, (pole_alpha, pole_beta) = nearest
+            text += '\nNearest %s: %.1f\u00b0 away at (%.1f, %.1f)' % (
+                label, angle, pole_alpha, pole_beta)
+        self.stage_text.set_text(text)
+        self.stage_text.set_visible(True)
+        self.blit_manager.update()
+        return nearest
+
+    def clear_stage_position(self):
+        self.stage_cursor.set_visible(False)
+        self.stage_text.set_visible(False)
+        self.blit_manager.update()
+
+    def start_stage_feed(self, source, interval=40):
+        """
+        Poll a stage_feed.StagePositionSource and follow it with the cursor.
+        :param interval: polling interval in ms.
+        """
+        self.stop_stage_feed()
+        self.stage_source = source
+        self._stage_timer = self.new_timer(interval=interval)
+        self._stage_timer.add_callback(self._poll_stage)
+        self._stage_timer.start()
+
+    def stop_stage_feed(self):
+        if self._stage_timer is not None:
+            self._stage_timer.stop()
+            self._stage_timer = None
+        if self.stage_source is not None:
+            self.stage_source.close()
+            self.stage_source = None
+
+    def _poll_stage(self):
+        position = self.stage_source.read()
+        if position is not None:
+            self.set_stage_position(*position)
+
+    def draw(self):
+        with phase('PolePlot.draw'):
+            FigureCanvas.draw(self)
+
 class PolePlotOld(FigureCanvas):
 
     def __init__(self, parent=None, width=4, height=4, dpi=200):
@@ -255,9 +176,7 @@ class PolePlotOld(FigureCanvas):
             crystal.a, crystal.b, crystal.c,
             crystal.alpha, crystal.beta, crystal.gamma)
         # get family of directions
-        with open('data/markers.json', 'r') as fp:
-            ddict = json.load(fp)
-            direction_dict = ddict[ddict['Current']]
+        direction_dict = get_store().current()
 
 
         #print(direction_dict['111'])
@@ -0,0 +1,301 @@
+"""
+Drawing of pole figures onto a matplotlib Figure, without any GUI toolkit.
+
+PoleRenderer holds the artists of one pole figure. PolePlot wraps it in a
+Qt canvas; batch_render uses it with the Agg canvas only.
+"""
+from collections import OrderedDict
+
+import matplotlib.figure
+import numpy as np
+
+from crystal_math import (int_direction_to_bar_string, interface_tilt_path,
+                          stage_vectors)
+from instrumentation import phase
+from profile_store import DEFAULT_PATH, get_store
+
+
+class PoleCache:
+    """
+    Least recently used cache of computed pole positions. Entries are keyed
+    on the lattice and orientation of the crystal, the marker profile and
+    its store version, and the tilt window, so any edit is a new key.
+    :param maxsize: number of entries kept.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Cached value of key, calling compute() to fill it if missing."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = compute()
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+# shared by every PoleRenderer, so the main window and any tilt series
+# windows reuse each other's results
+pole_cache = PoleCache()
+
+
+def _hashable(value):
+    # nested tuples, so ragged values like a basis mixing [x, y, z] and
+    # [x, y, z, f] atoms hash too
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+def crystal_key(crystal):
+    """Hashable key of everything that moves or hides a crystal's poles."""
+    return tuple(_hashable(getattr(crystal, field))
+                 for field in (crystal.orientation_fields +
+                               crystal.extinction_fields))
+
+
+class PoleRenderer:
+    """
+    Pole figure kept in retained mode. The axes are styled and the artists
+    created once; plot() only updates their offsets, colours and visibility.
+    Pole scatters are rebuilt only when the compiled marker profile changes.
+
+    With group_by_marker the poles are drawn with one collection per marker
+    shape and per-point colours and sizes, rather than one per family.
+
+    :param fig: Figure to draw on, a new one if None.
+    :param markers: marker profile file, relative to the working directory.
+    :param cache: PoleCache of computed poles, None to always recompute.
+    """
+
+    def __init__(self, fig=None, group_by_marker=True, markers=DEFAULT_PATH,
+                 cache=pole_cache):
+        self.markers = markers
+        self.cache = cache
+        self.fig = matplotlib.figure.Figure() if fig is None else fig
+        self.ax = self.fig.add_subplot(111)
+        self.ax.axis('off')
+        self.ax.set_aspect('equal', 'box')
+
+        # color
+        self.ax.set_facecolor((0,0,0))
+        self.fig.patch.set_facecolor((0,0,0))
+        self.ax.spines['bottom'].set_color('w')
+        self.ax.spines['top'].set_color('w')
+        self.ax.spines['right'].set_color('w')
+        self.ax.spines['left'].set_color('w')
+        self.ax.tick_params(axis='x', colors='white')
+        self.ax.tick_params(axis='y', colors='white')
+        self._style_axes()
+
+        # pole scatters, rebuilt with the profile. pole_indices are the
+        # directions of the compiled profile currently drawn by each scatter.
+        self.group_by_marker = group_by_marker
+        self.pole_scatters = []
+        self.pole_indices = []
+        self.pole_labels = []
+        self.pole_colors = []
+        self._profile = None
+        self._grouped = None
+        self._groups = []
+        self._labels = None
+        self._profile_labels = None
+        self._orders = None
+
+        # stage vectors of the directions on screen for the plotted crystal,
+        # rows of the profile they belong to, and [alpha, beta] of every
+        # row, for nearest pole lookups
+        self.crystal = None
+        self.pole_vectors = np.empty((0, 3))
+        self._shown = np.empty(0, dtype=int)
+        self._coordinates = np.empty((0, 2))
+
+        self.interface_scatters = [
+            self.ax.scatter([], [], color=color, marker='.', s=1,
+                            visible=False) for color in ('blue', 'red')]
+        self.interface_names = ['Along Interface', 'Across Interface']
+        self.interface_colors = ['blue', 'red']
+
+    def _style_axes(self):
+        ax = self.ax
+        ax.spines['left'].set_position('zero')
+        ax.spines['right'].set_color('none')
+        ax.spines['bottom'].set_position('zero')
+        ax.spines['top'].set_color('none')
+        # smart bounds were removed in matplotlib 3.4
+        if hasattr(ax.spines['left'], 'set_smart_bounds'):
+            ax.spines['left'].set_smart_bounds(True)
+            ax.spines['bottom'].set_smart_bounds(True)
+        ax.xaxis.set_ticks_position('bottom')
+        ax.yaxis.set_ticks_position('left')
+
+    def hover_layers(self):
+        """(collection, labels, colors) of everything plotted, for hover."""
+        return (list(zip(self.pole_scatters, self.pole_labels,
+                         self.pole_colors)) +
+                list(zip(self.interface_scatters, self.interface_names,
+                         self.interface_colors)))
+
+    def plot(self, crystal, interface_alpha=None, interface_beta=None,
+             interface_rotation=None, xlim=45, ylim=45, profile=None,
+             poles=None):
+        """
+        Update the artists. Nothing is drawn until the canvas draws.
+        :param profile: name of the marker profile, the current if None.
+        :param poles: 'direction' or 'plane' to plot every family as lattice
+                      directions or plane normals, None to follow the
+                      profile.
+        """
+        ax = self.ax
+        if not ax.axison:
+            ax.axis('on')
+            self.fig.tight_layout()
+
+        ax.set_xlim(-1 * xlim, xlim)
+        ax.set_ylim(-1 * ylim, ylim)
+
+        if crystal is not None:
+            # families expanded once per marker profile
+            with phase('PolePlot.plot: load profile'):
+                store = get_store(self.markers)
+                name = store.current_name() if profile is None else profile
+                system = crystal.symmetry_key
+            with phase('PolePlot.plot: expand families'):
+                profile = store.compiled(name, system, poles)
+
+            with phase('PolePlot.plot: transform'):
+                if self.cache is None:
+                    poles = self._transform(crystal, profile, xlim, ylim)
+                else:
+                    key = (crystal_key(crystal), system, store.path, name,
+                           poles, store.version, xlim, ylim)
+                    poles = self.cache.get(key, lambda: self._transform(
+                        crystal, profile, xlim, ylim))
+                (visible, orders, self._coordinates, self._shown,
+                 self.pole_vectors) = poles
+
+            with phase('PolePlot.plot: scatter'):
+                self._update_poles(profile, visible, orders,
+                                   self._coordinates)
+            self.crystal = crystal
+        else:
+            for sc in self.pole_scatters:
+                sc.set_visible(False)
+            self.crystal = None
+            self._coordinates = np.empty((0, 2))
+            self._shown = np.empty(0, dtype=int)
+            self.pole_vectors = np.empty((0, 3))
+
+        if (interface_alpha is not None and interface_beta is not None and
+                interface_rotation is not None):
+            for sc, rotation in zip(self.interface_scatters,
+                                    (interface_rotation,
+                                     interface_rotation + 90)):
+                sc.set_offsets(interface_tilt_path(
+                    interface_alpha, interface_beta, rotation, step_size=0.1))
+                sc.set_visible(True)
+        else:
+            for sc in self.interface_scatters:
+                sc.set_visible(False)
+
+    @staticmethod
+    def _transform(crystal, profile, xlim, ylim):
+        # only directions that can fall in the window are transformed, and
+        # planes only if some order of them reflects. orders is that lowest
+        # order, 1 for directions.
+        orders = np.ones(len(profile), dtype=int)
+        if profile.planes.any():
+            orders[profile.planes] = crystal.reflection_orders(
+                profile.directions[profile.planes])
+        visible = (orders > 0) & crystal.in_tilt_window(
+            profile.directions, xlim, ylim, profile.planes)
+        all_coordinates = np.full((len(profile), 2), np.nan)
+        all_coordinates[visible] = crystal.stage_coordinates(
+            profile.directions[visible], profile.planes[visible])
+        # the nearest pole is searched among the poles on screen only
+        with np.errstate(invalid='ignore'):
+            shown = np.flatnonzero(
+                (np.abs(all_coordinates[:, 0]) <= xlim) &
+                (np.abs(all_coordinates[:, 1]) <= ylim))
+        pole_vectors = crystal.pole_vectors(profile.directions[shown],
+                                            profile.planes[shown])
+        # shared through the cache
+        for array in (visible, orders, all_coordinates, shown, pole_vectors):
+            array.setflags(write=False)
+        return visible, orders, all_coordinates, shown, pole_vectors
+
+    def nearest_pole(self, alpha, beta):
+        """
+        Plotted direction on screen closest to the beam at a stage position.
+        :return: (label, angle between beam and direction in degrees,
+                 [alpha, beta] of the direction) or None without a crystal
+                 or poles on screen.
+        """
+        if self.crystal is None or not len(self.pole_vectors):
+            return None
+        cosines = self.pole_vectors @ stage_vectors(alpha, beta)
+        nearest = np.argmax(cosines)
+        angle = np.rad2deg(np.arccos(np.clip(cosines[nearest], -1, 1)))
+        row = self._shown[nearest]
+        return self._labels[row], angle, self._coordinates[row]
+
+    def _update_poles(self, profile, visible, orders, coordinates):
+        if (profile is not self._profile or
+                self.group_by_marker != self._grouped):
+            # new profile, replace the pole scatters
+            for sc in self.pole_scatters:
+                sc.remove()
+            if self.group_by_marker:
+                self._groups = profile.marker_groups
+            else:
+                self._groups = [
+                    (profile.family_markers[i],
+                     np.arange(len(profile))[profile.family_slice(i)])
+                    for i in range(len(profile.families))]
+            # <uvw> for directions, (hkl) for plane normals
+            self._profile_labels = np.array(
+                [('(%s)' if planes else '<%s>') % label for label, planes
+                 in zip(profile.labels, profile.planes)], dtype=object)
+            self._orders = None
+            self.pole_scatters = [self.ax.scatter([], [], marker=marker)
+                                  for marker, _ in self._groups]
+            self._profile = profile
+            self._grouped = self.group_by_marker
+
+        # planes whose first order is forbidden are labelled by the lowest
+        # order that reflects, e.g. (200). orders is shared by cache hits.
+        if orders is not self._orders:
+            self._labels = self._profile_labels.copy()
+            for i in np.flatnonzero(orders > 1):
+                self._labels[i] = '(%s)' % int_direction_to_bar_string(
+                    orders[i] * np.array(profile.label_indices[i]))
+            self._orders = orders
+
+        # the scatters only hold the poles that passed the window test
+        self.pole_indices = []
+        self.pole_labels = []
+        self.pole_colors = []
+        for sc, (marker, indices) in zip(self.pole_scatters, self._groups):
+            indices = indices[visible[indices]]
+            sc.set_offsets(coordinates[indices])
+            sc.set_sizes(profile.sizes[indices])
+            sc.set_facecolor(profile.colors[indices])
+            sc.set_visible(True)
+            self.pole_indices.append(indices)
+            self.pole_labels.append(self._labels[indices])
+            self.pole_colors.append(profile.colors[indices])
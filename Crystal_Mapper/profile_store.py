@@ -0,0 +1,250 @@
+"""
+In memory cache of the pole marker profiles in data/markers.json.
+
+The file holds {"Current": <profile name>, <profile name>: {<family>: {
+"color": [r, g, b], "marker": <matplotlib marker>, "ms": <size>}}}. It is
+parsed once and re-read only when its modification time or size changes,
+so redraws cost a stat() rather than an open() and json.load().
+"""
+import copy
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from crystal_math import (string_direction_to_int, int_direction_to_bar_string,
+                          laue_operators, three_to_four_index,
+                          four_to_three_index)
+from equivalent_planes import expand_families
+
+DEFAULT_PATH = os.path.join('data', 'markers.json')
+
+
+class ProfileStore:
+    """
+    Marker profiles of one markers.json file.
+    version increases whenever the profiles change, on disk or through
+    update(), so callers can cache anything derived from a profile.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.version = 0
+        self._markerdict = None
+        self._stamp = None
+        self._compiled = {}
+
+    def _refresh(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            with open(self.path, 'r') as fp:
+                self._markerdict = json.load(fp)
+            self._stamp = stamp
+            self.version += 1
+        return self._markerdict
+
+    def current_name(self):
+        return self._refresh()['Current']
+
+    def current(self):
+        """Current profile. Shared with the store, do not modify."""
+        markerdict = self._refresh()
+        return markerdict[markerdict['Current']]
+
+    def profile(self, name):
+        """Named profile. Shared with the store, do not modify."""
+        return self._refresh()[name]
+
+    def compiled(self, name=None, system=None, poles=None):
+        """
+        CompiledProfile of the named (default current) profile, cached until
+        the profiles change.
+        :param system: crystal system key used to expand the families, see
+                       CompiledProfile.
+        :param poles: 'direction' or 'plane' to treat every family as such,
+                      None to follow the profile.
+        """
+        markerdict = self._refresh()
+        if name is None:
+            name = markerdict['Current']
+        key = (name, system, poles, self.version)
+        if key not in self._compiled:
+            self._compiled = {k: compiled for k, compiled in
+                              self._compiled.items() if k[-1] == self.version}
+            self._compiled[key] = CompiledProfile(markerdict[name], system,
+                                                  poles)
+        return self._compiled[key]
+
+    def profile_names(self):
+        return [name for name in self._refresh() if name != 'Current']
+
+    def data(self):
+        """Copy of the whole file contents, safe to edit."""
+        return copy.deepcopy(self._refresh())
+
+    def update(self, profiles=None, deleted=(), current=None):
+        """
+        Save changed profiles. Only the given profiles are replaced in the
+        latest file contents, so other profiles edited elsewhere are kept.
+        The file is written atomically and only if something changed.
+        :param profiles: dict of profile name -> profile to add or replace.
+        :param deleted: names of profiles to remove.
+        :param current: name of the profile to make current.
+        """
+        markerdict = copy.deepcopy(self._refresh())
+        for name, profile in (profiles or {}).items():
+            markerdict[name] = copy.deepcopy(profile)
+        for name in deleted:
+            markerdict.pop(name, None)
+        if current is not None:
+            markerdict['Current'] = current
+        if markerdict != self._markerdict:
+            self._write(markerdict)
+
+    def save_all(self, markerdict):
+        """Replace the whole file contents."""
+        self._write(copy.deepcopy(markerdict))
+
+    def _write(self, markerdict):
+        # write to a temporary file in the same directory and move it over
+        # the old file so readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(markerdict, fp, sort_keys=True, indent=4)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._markerdict = markerdict
+        stat = os.stat(self.path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+        self.version += 1
+
+
+# all sign combinations of a direction, after the direction itself
+_SIGNS = np.array([[1, 1, 1]] + [[u, v, w] for u in (-1, 1)
+                                  for v in (-1, 1) for w in (-1, 1)])
+_SIGN_OPERATORS = np.array([np.diag(signs) for signs in _SIGNS])
+
+
+class CompiledProfile:
+    """
+    Marker profile expanded into flat arrays ready for plotting.
+    Families are expanded by the Laue class operators of a crystal system
+    (crystal_math.laue_operators), or without a system to every sign
+    combination of their indices. Each distinct direction appears once,
+    in the first family of the same type that reaches it. Families written
+    with four Miller-Bravais indices are expanded as [UVW] and labelled as
+    [uvtw].
+
+    A family is a plane family if its entry has "type": "plane", or if
+    poles is 'plane'. Its indices are (hkl) and it is expanded with the
+    operators on plane indices; the plot puts the plane normals along the
+    beam.
+
+    families: list of F family keys.
+    directions: (N,3) int array of all expanded directions, or plane
+                indices where planes is True.
+    family: (N,) index into families of every direction.
+    bounds: (F+1,) start of each family's directions in directions.
+    four_index: (F,) bool, families given as Miller-Bravais indices.
+    family_planes, planes: (F,) and (N,) bool, plane families.
+    labels: N overbar strings of the directions, e.g. '11\u03051'.
+    label_indices: N lists of the labelled indices, four for Miller-Bravais
+                   families.
+    colors, sizes, markers: per direction style, colors as (N,3) RGB 0-1.
+    family_colors, family_sizes, family_markers: per family style.
+    marker_groups: (marker, indices into directions) for every marker shape
+                   in the profile, in order of first use.
+    """
+
+    def __init__(self, profile, system=None, poles=None):
+        self.system = system
+        self.families = list(profile)
+        self.family_colors = np.array([profile[f]['color'] for f in
+                                       self.families],
+                                      dtype=float).reshape(-1, 3) / 255
+        self.family_sizes = np.array([profile[f]['ms'] for f in
+                                      self.families], dtype=float)
+        self.family_markers = [profile[f]['marker'] for f in self.families]
+
+        indices = [string_direction_to_int(f) for f in self.families]
+        self.four_index = np.array([len(i) == 4 for i in indices], dtype=bool)
+        keys = np.zeros((len(indices), 3), dtype=int)
+        if (~self.four_index).any():
+            keys[~self.four_index] = [i for i in indices if len(i) == 3]
+        if poles is None:
+            self.family_planes = np.array(
+                [profile[f].get('type', 'direction') == 'plane'
+                 for f in self.families], dtype=bool)
+        else:
+            self.family_planes = np.full(len(self.families), poles == 'plane')
+        for planes in (False, True):
+            four = self.four_index & (self.family_planes == planes)
+            if four.any():
+                keys[four] = four_to_three_index(
+                    [i for i, f in zip(indices, four) if f], planes)
+
+        # directions and planes are expanded separately, so a plane never
+        # hides the direction with the same indices
+        directions = []
+        family = []
+        for planes in (False, True):
+            subset = np.flatnonzero(self.family_planes == planes)
+            if not len(subset):
+                continue
+            if system is None:
+                operators = _SIGN_OPERATORS
+            else:
+                operators = laue_operators(system, planes)
+            expanded, index = expand_families(keys[subset], operators)
+            directions.append(expanded)
+            family.append(subset[index])
+        if directions:
+            directions = np.concatenate(directions)
+            family = np.concatenate(family)
+        else:
+            directions = np.empty((0, 3), dtype=int)
+            family = np.empty(0, dtype=int)
+        order = np.argsort(family, kind='stable')
+        self.directions = directions[order]
+        self.family = family[order]
+        self.planes = self.family_planes[self.family]
+        self.bounds = np.searchsorted(self.family,
+                                      np.arange(len(self.families) + 1))
+
+        self.colors = self.family_colors[self.family]
+        self.sizes = self.family_sizes[self.family]
+        self.markers = np.array(self.family_markers, dtype=object)[
+            self.family]
+        self.label_indices = labels = self.directions.tolist()
+        for planes in (False, True):
+            four_index = np.flatnonzero(self.four_index[self.family] &
+                                        (self.planes == planes))
+            for i, d in zip(four_index, three_to_four_index(
+                    self.directions[four_index], planes).tolist()):
+                labels[i] = d
+        self.labels = [int_direction_to_bar_string(d) for d in labels]
+        self.marker_groups = [(marker, np.flatnonzero(self.markers == marker))
+                              for marker in dict.fromkeys(self.family_markers)]
+
+    def __len__(self):
+        return len(self.directions)
+
+    def family_slice(self, index):
+        return slice(self.bounds[index], self.bounds[index + 1])
+
+
+_stores = {}
+
+
+def get_store(path=DEFAULT_PATH):
+    """Shared ProfileStore for a markers file. (relative to the cwd)"""
+    key = os.path.abspath(path)
+    if key not in _stores:
+        _stores[key] = ProfileStore(key)
+    return _stores[key]
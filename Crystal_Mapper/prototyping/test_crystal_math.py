@@ -1,7 +1,23 @@
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
 
 from crystal_math import *
+import crystal_math
+import instrumentation
+from profile_store import CompiledProfile, ProfileStore
+from equivalent_planes import expand_families, family_of_directions
+import make_marker_json
+from hover import BlitManager, HoverAnnotation, PointIndex
+from pole_renderer import PoleCache, PoleRenderer
+from stage_feed import (LatestPositionFeed, SimulatedStageFeed,
+                        StagePositionSource)
+import angle_table
+from angle_table import AngleTable, get_angle_table
+from batch_render import make_jobs, render_sample
 """Unit Test for crystal_math"""
 
 class Test_Stage_Coordinates(unittest.TestCase):
@@ -42,6 +58,947 @@ class Test_Stage_Coordinates(unittest.TestCase):
                                        reference_pole, rotation)
             self.assertEqual((alpha,beta), result)
 
+class Test_Stage_Coordinates_Array(unittest.TestCase):
+    knownValues = Test_Stage_Coordinates.knownValues
+
+    def testToKnownValues(self):
+        for (direction, zone_axis, a0, b0, reference_pole, rotation,
+             alpha, beta) in self.knownValues:
+            result = stage_coordinates_array([direction], zone_axis, a0, b0,
+                                             reference_pole, rotation)
+            self.assertEqual((alpha, beta), tuple(result[0]))
+
+    def testMatchesScalar(self):
+        directions = [[u, v, w] for u in range(-2, 3) for v in range(-2, 3)
+                      for w in range(-2, 3) if [u, v, w] != [0, 0, 0]]
+        result = stage_coordinates_array(directions, [1, 1, 2], 12.5, -7.3,
+                                         [1, -1, 0], 23)
+        expected = [stage_coordinates(d, [1, 1, 2], 12.5, -7.3,
+                                      [1, -1, 0], 23) for d in directions]
+        np.testing.assert_array_equal(result, expected)
+
+    def testBetaHalfTurn(self):
+        # like stage_coordinates, beta = -180 is kept and only smaller
+        # betas wrap around
+        betas = np.deg2rad([-180, -180.5, -179.5])
+        _, folded = crystal_math._fold_tilts(np.zeros(3), betas, False)
+        np.testing.assert_almost_equal(np.rad2deg(folded),
+                                       [-180, 179.5, -179.5])
+
+class Test_Crystal_Orientation(unittest.TestCase):
+    knownValues = Test_Stage_Coordinates.knownValues
+
+    def testToKnownValues(self):
+        for (direction, zone_axis, a0, b0, reference_pole, rotation,
+             alpha, beta) in self.knownValues:
+            crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, zone_axis,
+                              rotation, reference_pole, [0, 0, 1], a0, b0)
+            result = crystal.stage_coordinates(direction)
+            # compare beam directions so that beta = +/-180 are equal
+            np.testing.assert_almost_equal(stage_vectors(*result),
+                                           stage_vectors(alpha, beta), 3)
+
+    def testDirectionGivenTilt(self):
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2], 23,
+                          [1, -1, 0], [0, 0, 1], 12.5, -7.3)
+        alpha, beta = crystal.stage_coordinates([1, 0, 3])
+        result = crystal.direction_given_tilt(alpha, beta)
+        np.testing.assert_almost_equal(result / result[0], [1, 0, 3], 2)
+
+    def testDirectionGivenTiltBatch(self):
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2], 12,
+                          [1, -1, 0], [0, 1, 0], 5, -8)
+        directions = [[1, 1, 2], [1, 0, 3], [-1, 2, 5]]
+        tilts = crystal.stage_coordinates(directions)
+        result = crystal.direction_given_tilt(tilts[:, 0], tilts[:, 1])
+        np.testing.assert_almost_equal(
+            result / np.linalg.norm(result, axis=1)[:, None],
+            directions / np.linalg.norm(directions, axis=1)[:, None], 3)
+        alpha, beta, grid = crystal.tilt_map(10, 20, 0.5)
+        self.assertEqual(grid.shape, (81, 41, 3))
+        self.assertAlmostEqual(alpha[24, 30], 5)
+        self.assertAlmostEqual(beta[24, 30], -8)
+        np.testing.assert_almost_equal(
+            grid[24, 30] / np.linalg.norm(grid[24, 30]),
+            np.array([1, 1, 2]) / np.sqrt(6))
+
+    def testInTiltWindowKeepsVisible(self):
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2], 23,
+                          [1, -1, 0], [0, 0, 1], 12.5, -7.3)
+        directions = np.array([[u, v, w] for u in range(-4, 5)
+                               for v in range(-4, 5) for w in range(-4, 5)
+                               if (u, v, w) != (0, 0, 0)])
+        for xlim, ylim in ((45, 45), (20, 60), (10, 10)):
+            tilts = crystal.stage_coordinates(directions)
+            inside = ((np.abs(tilts[:, 0]) <= xlim) &
+                      (np.abs(tilts[:, 1]) <= ylim))
+            kept = crystal.in_tilt_window(directions, xlim, ylim)
+            self.assertFalse((inside & ~kept).any())
+            self.assertLess(kept.sum(), len(directions) / 2)
+
+    def testPoleVectors(self):
+        crystal = Crystal('C', 'Hexagonal', 3, 3, 5, 90, 90, 120, [0, 0, 1],
+                          30, [1, 0, 0], [0, 1, 0], -3, 4)
+        directions = [[0, 0, 1], [1, 0, 1], [2, -1, 3]]
+        tilts = crystal.stage_coordinates(directions)
+        np.testing.assert_almost_equal(crystal.pole_vectors(directions),
+                                       stage_vectors(tilts[:, 0], tilts[:, 1]),
+                                       3)
+
+    def testCacheInvalidation(self):
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [0, 0, 1], 0,
+                          [0, 1, 0], [0, 0, 1], 0, 0)
+        np.testing.assert_almost_equal(crystal.stage_coordinates([0, 0, 1]),
+                                       [0, 0])
+        crystal.a0 = 10
+        crystal.b0 = -10
+        np.testing.assert_almost_equal(crystal.stage_coordinates([0, 0, 1]),
+                                       [10, -10])
+
+class Test_Lattice(unittest.TestCase):
+
+    def testReciprocal(self):
+        lattice = get_lattice(3.2, 3.2, 5.1, 90, 90, 120)
+        directions = np.eye(3)
+        np.testing.assert_almost_equal(
+            lattice.directions_to_cartesian(directions) @
+            lattice.planes_to_cartesian(directions).T, np.eye(3))
+        self.assertAlmostEqual(lattice.volume,
+                               np.sqrt(np.linalg.det(lattice.metric)))
+
+    def testMatchesScalar(self):
+        directions = [[1, 0, 0], [1, 1, 0], [1, 2, 3], [-2, 1, 1]]
+        lattice = get_lattice(5.22, 5.27, 5.38, 90, 99.46, 90)
+        result = lattice.directions_to_cartesian(directions)
+        for direction, vector in zip(directions, result):
+            np.testing.assert_almost_equal(
+                vector, np.matmul(get_M(5.22, 5.27, 5.38, 90, 99.46, 90),
+                                  direction))
+        np.testing.assert_almost_equal(
+            lattice.cartesian_to_directions(result), directions)
+
+    def testShared(self):
+        self.assertIs(get_lattice(1, 1, 1, 90, 90, 90),
+                      get_lattice(1, 1, 1, 90, 90, 90))
+
+class Test_Interface_Tilt_Path(unittest.TestCase):
+
+    @staticmethod
+    def baseline(alpha, beta, rotation=0, step_size=0.1):
+        # the per-point loop interface_tilt_path replaced
+        out = []
+        sin_alpha = np.sin(np.deg2rad(alpha))
+        cos_alpha = np.cos(np.deg2rad(alpha))
+        cos_phi = np.cos(np.deg2rad(rotation))
+        sin_phi = np.sin(np.deg2rad(rotation))
+        for theta in np.arange(-90, 90, step_size):
+            sin_theta = np.sin(np.deg2rad(theta))
+            cos_theta = np.cos(np.deg2rad(theta))
+            tan_theta = np.tan(np.deg2rad(theta))
+            x = np.round(np.rad2deg(np.arcsin(
+                sin_theta * cos_phi * cos_alpha + sin_alpha * cos_theta)), 2)
+            y = np.round(np.rad2deg(np.arctan(
+                (tan_theta * sin_phi) /
+                (cos_alpha - sin_alpha * tan_theta * cos_phi))) + beta, 2)
+            out.append([x, y])
+        return out
+
+    def testMatchesBaseline(self):
+        for rotation in (0, 30, 120):
+            np.testing.assert_array_equal(
+                interface_tilt_path(12, -8, rotation, 0.5),
+                self.baseline(12, -8, rotation, 0.5))
+        np.testing.assert_array_equal(
+            along_interface_tilt_coordinates(12, -8, 30, 0.5),
+            self.baseline(12, -8, 30, 0.5))
+        np.testing.assert_array_equal(
+            normal_to_interface_tilt_coordinates(12, -8, 30, 0.5),
+            self.baseline(12, -8, 120, 0.5))
+
+    def testHolderLimits(self):
+        path = interface_tilt_path(12, -8, 30, 0.01, 40, 25)
+        expected = [[x, y] for x, y in self.baseline(12, -8, 30, 0.01)
+                    if abs(x) < 40 and abs(y) < 25]
+        np.testing.assert_array_equal(path, expected)
+
+class Test_Band_Coordinates_Array(unittest.TestCase):
+    knownValues = ((0, 0, 0), (10, -5, 30), (-20, 15, 120), (40, 40, 45))
+
+    @staticmethod
+    def baseline(xtilt, ytilt, rotation, step_size=0.1):
+        # the per-point loop of get_band_coordinates before it was batched
+        x = []
+        y = []
+        sin_alpha = np.sin(np.deg2rad(xtilt))
+        cos_alpha = np.cos(np.deg2rad(xtilt))
+        cos_rotation = np.cos(np.deg2rad(rotation))
+        sin_rotation = np.sin(np.deg2rad(rotation))
+        for i in np.arange(-90, 90, step_size):
+            sin_i = np.sin(np.deg2rad(i))
+            cos_i = np.cos(np.deg2rad(i))
+            tan_i = np.tan(np.deg2rad(i))
+            next_x = np.rad2deg(
+                np.arcsin(sin_i*cos_rotation*cos_alpha + sin_alpha * cos_i))
+            next_y = (np.rad2deg(np.arctan(
+                tan_i*sin_rotation/cos_alpha - sin_alpha*tan_i*cos_rotation))
+                + ytilt)
+            if np.sqrt(next_x**2 + next_y**2) <= 45:
+                x.append(next_x)
+                y.append(next_y)
+        return x, y
+
+    def testMatchesBaseline(self):
+        traces = band_coordinates_array(self.knownValues)
+        for (x, y, angle), trace in zip(self.knownValues, traces):
+            expected = np.column_stack(self.baseline(x, y, angle))
+            np.testing.assert_almost_equal(
+                trace.compressed().reshape(-1, 2), expected)
+            np.testing.assert_almost_equal(
+                np.column_stack(get_band_coordinates(x, y, angle)), expected)
+
+class Test_Misorientations(unittest.TestCase):
+
+    def testRotationAboutZoneAxis(self):
+        crystals = [Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [0, 0, 1],
+                            rotation, [1, 0, 0], [0, 0, 1], 5, -3)
+                    for rotation in (0, 30, 180)]
+        angles, axes = misorientations(crystals)
+        np.testing.assert_almost_equal(np.diag(angles), [0, 0, 0], 5)
+        np.testing.assert_almost_equal(angles[0, 1:], [30, 180])
+        np.testing.assert_almost_equal(angles, angles.T)
+        np.testing.assert_almost_equal(np.abs(axes[0, 1]), [0, 0, 1])
+        np.testing.assert_almost_equal(np.abs(axes[0, 2]), [0, 0, 1])
+
+    def testHalfTurnAxisSign(self):
+        # the axis keeps its sign across the half turn branch
+        crystals = [Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 2, 3],
+                            rotation, [3, 0, -1], [0, 0, 1], 5, -3)
+                    for rotation in (0, 170, 179.5)]
+        angles, axes = misorientations(crystals)
+        np.testing.assert_almost_equal(angles[0, 1:], [170, 179.5])
+        np.testing.assert_almost_equal(axes[0, 2], axes[0, 1], 4)
+
+    def testMatchesMatrix(self):
+        c1 = Crystal('C1', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 0, 1], 79,
+                     [0, 1, 0], [0, 1, 0], 6.3, -20.1)
+        c2 = Crystal('C2', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2], -32.4,
+                     [1, -1, 0], [0, 1, 0], -4, 11)
+        matrix = misorientation_matrix(c1, c2)
+        angles, axes = misorientations([c1, c2])
+        self.assertAlmostEqual(
+            angles[0, 1],
+            np.rad2deg(np.arccos((np.trace(matrix) - 1) * 0.5)))
+        np.testing.assert_almost_equal(matrix @ axes[0, 1], axes[0, 1])
+
+class Test_Disorientation(unittest.TestCase):
+    knownValues = ( ('Cubic', 3, 90, 90, 0),
+                    ('Cubic', 3, 90, 50, 40),
+                    ('Cubic', 3, 90, 20, 20),
+                    ('Hexagonal', 5, 120, 70, 10),
+                    ('Tetragonal', 5, 90, 135, 45),
+                    )
+
+    def testKnownValues(self):
+        for system, c, gamma, rotation, angle in self.knownValues:
+            crystals = [Crystal('X', system, 3, 3, c, 90, 90, gamma,
+                                [0, 0, 1], r, [1, 0, 0], [0, 0, 1], 0, 0)
+                        for r in (0, rotation)]
+            result, axis = disorientation(*crystals)
+            self.assertAlmostEqual(result, angle)
+
+    def testNotLargerThanMisorientation(self):
+        crystals = [Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2],
+                            rotation, [1, -1, 0], [0, 1, 0], a0, b0)
+                    for rotation, a0, b0 in ((0, 0, 0), (37, 12, -5),
+                                             (-81, -20, 33))]
+        angles, _ = disorientations(crystals)
+        np.testing.assert_array_less(angles, misorientations(crystals)[0]
+                                     + 1e-6)
+        np.testing.assert_array_less(angles, 62.8 + 1e-6)
+        np.testing.assert_almost_equal(angles, angles.T)
+
+
+class Test_Equivalent_Directions(unittest.TestCase):
+    # number of directions equivalent to a general direction
+    knownValues = (('Triclinic', 2), ('Monoclinic', 4), ('Orthorhombic', 8),
+                   ('Tetragonal', 16), ('Trigonal', 12),
+                   ('Trigonal (hexagonal axes)', 12), ('Hexagonal', 24),
+                   ('Cubic', 48))
+
+    def testGeneralDirection(self):
+        for system, count in self.knownValues:
+            directions = family_of_directions(['145'], system)['145']
+            self.assertEqual(len(directions), count)
+            self.assertIn([-1, -4, -5], directions)
+
+    def testCubic(self):
+        families = family_of_directions(['100', '110', '111'], 'Cubic')
+        self.assertEqual([len(families[f]) for f in families], [6, 12, 8])
+        self.assertEqual(families['100'][0], [1, 0, 0])
+
+    def testHexagonalPreservesLattice(self):
+        crystal = Crystal('H', 'Hexagonal', 3, 3, 5, 90, 90, 120, [0, 0, 1],
+                          0, [1, 0, 0], [0, 1, 0], 0, 0)
+        lattice = crystal.lattice
+        directions = np.array(family_of_directions(['101'], 'Hexagonal')['101'])
+        lengths = np.linalg.norm(lattice.directions_to_cartesian(directions),
+                                 axis=1)
+        self.assertEqual(len(directions), 12)
+        np.testing.assert_almost_equal(lengths, lengths[0])
+
+    def testFirstFamilyWins(self):
+        directions, family = expand_families(
+            [[0, 0, 1], [1, 0, 0]], crystal_math.laue_operators('Cubic'))
+        self.assertEqual(len(directions), 6)
+        np.testing.assert_array_equal(family, 0)
+
+
+class Test_Miller_Bravais(unittest.TestCase):
+    knownValues = (([1, 0, 0], [2, -1, -1, 0]),
+                   ([0, 1, 0], [-1, 2, -1, 0]),
+                   ([1, 1, 0], [1, 1, -2, 0]),
+                   ([0, 0, 1], [0, 0, 0, 1]),
+                   ([1, 0, 1], [2, -1, -1, 3]))
+
+    def testConversion(self):
+        three = np.array([k[0] for k in self.knownValues])
+        four = np.array([k[1] for k in self.knownValues])
+        np.testing.assert_array_equal(three_to_four_index(three), four)
+        np.testing.assert_array_equal(four_to_three_index(four), three)
+        np.testing.assert_array_equal(three_to_four_index([1, 0, 0]),
+                                      [2, -1, -1, 0])
+
+    def testParseDirection(self):
+        self.assertEqual(string_direction_to_int('1-10'), [1, -1, 0])
+        self.assertEqual(string_direction_to_int('2-1-10'), [2, -1, -1, 0])
+        self.assertEqual(string_direction_to_int('1 0 -12'), [1, 0, -12])
+        self.assertEqual(string_direction_to_int('<1,1,2>'), [1, 1, 2])
+        for invalid in ('12', '1x0', '1120'):
+            self.assertRaises(ValueError, string_direction_to_int, invalid)
+
+    def testLabels(self):
+        self.assertEqual(int_direction_to_bar_string([2, -1, -1, 0]),
+                         '21\u03051\u03050')
+        self.assertEqual(int_direction_to_bar_string([1, 0, -12]),
+                         '1 0 12\u0305')
+
+    def testFourIndexFamily(self):
+        compiled = CompiledProfile(
+            {'2-1-10': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5},
+             '0001': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5},
+             '100': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}},
+            'Hexagonal')
+        np.testing.assert_array_equal(compiled.bounds, [0, 6, 8, 8])
+        self.assertEqual(compiled.labels[0], '21\u03051\u03050')
+        self.assertEqual(len(set(compiled.labels[:6])), 6)
+        self.assertTrue(all(len(label.replace('\u0305', '')) == 4
+                            for label in compiled.labels))
+
+
+class Test_Plane_Poles(unittest.TestCase):
+
+    def setUp(self):
+        self.crystal = Crystal('H', 'Hexagonal', 3, 3, 5, 90, 90, 120,
+                               [0, 0, 1], 10, [1, 0, 0], [0, 1, 0], 10, -20)
+
+    def testNormalIsPerpendicular(self):
+        lattice = self.crystal.lattice
+        normal = lattice.poles_to_cartesian([[1, 0, 1]], True)[0]
+        for direction in ([0, 1, 0], [-1, 0, 1]):
+            self.assertAlmostEqual(
+                normal @ lattice.directions_to_cartesian(direction), 0)
+
+    def testMixedStageCoordinates(self):
+        indices = np.array([[1, 0, 1], [1, 0, 1], [0, 0, 1]])
+        planes = np.array([False, True, True])
+        result = self.crystal.stage_coordinates(indices, planes)
+        np.testing.assert_almost_equal(
+            result[0], self.crystal.stage_coordinates([1, 0, 1]))
+        np.testing.assert_almost_equal(result[2], [10, -20])
+        self.assertGreater(np.abs(result[0] - result[1]).max(), 1)
+
+    def testPlaneFamilies(self):
+        compiled = CompiledProfile(
+            {'10-11': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5,
+                       'type': 'plane'},
+             '101': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}},
+            'Hexagonal')
+        np.testing.assert_array_equal(compiled.family_planes, [True, False])
+        np.testing.assert_array_equal(compiled.bounds, [0, 12, 24])
+        self.assertEqual(compiled.labels[0], '101\u03051')
+        # all {10-11} normals are equally inclined to the c axis
+        normals = self.crystal.lattice.poles_to_cartesian(
+            compiled.directions[:12], True)
+        cosines = normals[:, 2] / np.linalg.norm(normals, axis=1)
+        np.testing.assert_almost_equal(np.abs(cosines), abs(cosines[0]))
+        forced = CompiledProfile(
+            {'101': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}},
+            'Hexagonal', poles='plane')
+        self.assertTrue(forced.planes.all())
+
+
+class Test_Extinction(unittest.TestCase):
+    # centering, basis, allowed (hkl), forbidden (hkl)
+    knownValues = (('I', None, [[1, 1, 0], [2, 0, 0]], [[1, 0, 0], [1, 1, 1]]),
+                   ('F', None, [[1, 1, 1], [2, 0, 0]], [[1, 0, 0], [1, 1, 0]]),
+                   ('F', [[0, 0, 0], [1/4, 1/4, 1/4]],
+                    [[1, 1, 1], [2, 2, 0]], [[2, 0, 0], [2, 2, 2]]),
+                   ('P', [[1/3, 2/3, 1/4], [2/3, 1/3, 3/4]],
+                    [[0, 0, 2], [1, 0, 1]], [[0, 0, 1], [1, 1, 1]]))
+
+    def testKnownValues(self):
+        for centering, basis, allowed, forbidden in self.knownValues:
+            table = ExtinctionTable(centering, basis, max_index=4)
+            self.assertTrue(table.allowed(allowed).all())
+            self.assertFalse(table.allowed(forbidden).any())
+
+    def testOutsideTable(self):
+        table = ExtinctionTable('F', max_index=2)
+        np.testing.assert_array_equal(
+            table.allowed([[3, 1, 1], [3, 1, 0], [-2, 2, 0]]),
+            [True, False, True])
+        self.assertFalse(table.allowed([5, 0, 0]))
+
+    def testCrystalCache(self):
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, centering='F')
+        table = crystal.extinction_table
+        self.assertIs(crystal.extinction_table, table)
+        self.assertFalse(crystal.allowed_reflections([1, 0, 0]))
+        crystal.centering = 'I'
+        self.assertIsNot(crystal.extinction_table, table)
+        self.assertTrue(crystal.allowed_reflections([1, 1, 0]))
+        self.assertEqual(Crystal.from_dict(crystal.to_dict()).centering, 'I')
+
+    def testNearestPoleIsAllowed(self):
+        families = ['100', '110', '111', '210', '211', '225', '311']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    family: {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}
+                    for family in families}}, fp)
+            renderer = PoleRenderer(markers=path, cache=None)
+            for centering in 'FI':
+                crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90,
+                                  [1, 1, 2], 12, [1, -1, 0], [0, 1, 0],
+                                  centering=centering)
+                renderer.plot(crystal, poles='plane')
+                for alpha in range(-40, 41, 10):
+                    for beta in range(-40, 41, 10):
+                        label = renderer.nearest_pole(alpha, beta)[0]
+                        text = label.strip('()').replace('\u0305', '')
+                        indices = [int(i) for i in (
+                            text.split() if ' ' in text else text)]
+                        self.assertTrue(
+                            crystal.allowed_reflections(indices), label)
+
+    def testLowestOrders(self):
+        table = ExtinctionTable('F', max_index=4)
+        np.testing.assert_array_equal(
+            table.lowest_orders([[1, 0, 0], [1, 1, 0], [1, 1, 1], [3, 1, 0],
+                                 [5, 1, 1], [5, 1, 0]]),
+            [2, 2, 1, 0, 1, 0])
+        self.assertEqual(table.lowest_orders([2, 1, 0]), 2)
+
+    def testHigherOrderPlanesPlotted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    family: {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}
+                    for family in ('100', '110', '111')}}, fp)
+            renderer = PoleRenderer(markers=path, cache=None)
+            for centering, expected in (('F', {'200', '220', '111'}),
+                                        ('I', {'200', '110', '222'})):
+                crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90,
+                                  [0, 0, 1], 0, [1, 0, 0], [0, 1, 0],
+                                  centering=centering)
+                renderer.plot(crystal, xlim=90, ylim=90, poles='plane')
+                # every family is plotted, by the indices of its lowest
+                # allowed order in any permutation and sign
+                labels = set(np.concatenate(renderer.pole_labels))
+                self.assertEqual(
+                    {''.join(sorted(label.strip('()').replace('\u0305', ''),
+                                    reverse=True)) for label in labels},
+                    expected)
+                self.assertEqual(renderer.nearest_pole(0, 0)[0], '(002)')
+
+
+class Test_Angle_Table(unittest.TestCase):
+
+    def setUp(self):
+        self.lattice = get_lattice(1, 1, 1, 90, 90, 90)
+
+    def testCubicFamilies(self):
+        table = AngleTable(self.lattice, 'Cubic', max_index=1)
+        np.testing.assert_array_equal(table.representatives,
+                                      [[0, 0, 1], [0, 1, 1], [1, 1, 1]])
+        np.testing.assert_almost_equal(
+            table.angles, [35.264, 45, 54.736, 60, 70.529, 90, 90, 90, 90],
+            3)
+        first, second, angles = table.query(54.7, 0.5)
+        self.assertEqual(first.tolist(), [[0, 0, 1]])
+        cosine = np.cos(angle_between(first[0], second[0]))
+        self.assertAlmostEqual(abs(cosine), 1 / np.sqrt(3))
+
+    def testQueryMatchesScan(self):
+        table = AngleTable(self.lattice, 'Cubic', max_index=4)
+        _, _, angles = table.query(30, 2)
+        np.testing.assert_array_equal(
+            angles, table.angles[np.abs(table.angles - 30) <= 2])
+        self.assertTrue((np.diff(table.angles) >= 0).all())
+
+    def testDiskCache(self):
+        lattice = get_lattice(3, 3, 5, 90, 90, 120)
+        with tempfile.TemporaryDirectory() as directory:
+            table = get_angle_table(lattice, 'Hexagonal', 2, True, directory)
+            self.assertIs(get_angle_table(lattice, 'Hexagonal', 2, True,
+                                          directory), table)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            path = os.path.join(directory, os.listdir(directory)[0])
+            loaded = AngleTable(lattice, 'Hexagonal', 2, True,
+                                np.load(path))
+        np.testing.assert_array_equal(loaded.rows, table.rows)
+        # basal plane normal is perpendicular to the prism plane normals
+        first, second, _ = table.query(90, 1e-6)
+        basal = second[(first == [0, 0, 1]).all(axis=1)]
+        self.assertIn([0, 1, 0], basal.tolist())
+        np.testing.assert_array_equal(basal[:, 2], 0)
+
+    def testUserCacheDir(self):
+        package = os.path.dirname(os.path.abspath(angle_table.__file__))
+        self.assertFalse(os.path.abspath(angle_table.DEFAULT_CACHE_DIR)
+                         .startswith(package + os.sep))
+        if os.name != 'nt':
+            with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/cache'}):
+                self.assertEqual(angle_table._user_cache_dir(), os.path.join(
+                    '/cache', 'Crystal_Mapper', 'angle_tables'))
+
+    def testStaleCacheRebuilt(self):
+        lattice = get_lattice(2, 2, 7, 90, 90, 90)
+        key = angle_table._table_key(lattice, 'Tetragonal', 2, False)
+        expected = AngleTable(lattice, 'Tetragonal', 2).rows
+        with tempfile.TemporaryDirectory() as directory:
+            path = angle_table._cache_path(key, directory)
+            for stale in (np.arange(3.0), b'not a table'):
+                angle_table._tables.pop(key, None)
+                if isinstance(stale, bytes):
+                    with open(path, 'wb') as fp:
+                        fp.write(stale)
+                else:
+                    np.save(path, stale)
+                table = get_angle_table(lattice, 'Tetragonal', 2, False,
+                                        directory)
+                np.testing.assert_array_equal(table.rows, expected)
+                np.testing.assert_array_equal(np.load(path), expected)
+                # written through a temporary file, nothing else is left
+                self.assertEqual(os.listdir(directory),
+                                 [os.path.basename(path)])
+
+
+class Test_Instrumentation(unittest.TestCase):
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def testDisabledLeavesKernelsUntouched(self):
+        self.assertFalse(hasattr(crystal_math.stage_vectors, '__wrapped__'))
+        stage_vectors(1, 2)
+        self.assertEqual(instrumentation.stats(), {})
+
+    def testRecordsCalls(self):
+        instrumentation.enable()
+        crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [0, 0, 1], 0,
+                          [1, 0, 0], [0, 0, 1], 0, 0)
+        crystal.stage_coordinates(np.eye(3))
+        with instrumentation.phase('test phase'):
+            crystal_math.stage_vectors(np.zeros(4), np.zeros(4))
+        stats = json.loads(instrumentation.export_json())
+        self.assertEqual(stats['Crystal.stage_coordinates']['calls'], 1)
+        self.assertEqual(stats['stage_vectors']['elements'], 8)
+        self.assertEqual(stats['test phase']['calls'], 1)
+        instrumentation.disable()
+        self.assertFalse(hasattr(crystal_math.stage_vectors, '__wrapped__'))
+        self.assertFalse(hasattr(Crystal.stage_coordinates, '__wrapped__'))
+
+    def testPlotPhases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    '110': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}}}, fp)
+            renderer = PoleRenderer(markers=path, cache=None)
+            instrumentation.enable()
+            renderer.plot(Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90,
+                                  [0, 0, 1], 0, [1, 0, 0], [0, 0, 1], 0, 0))
+        stats = instrumentation.stats()
+        for name in ('load profile', 'expand families', 'transform',
+                     'scatter'):
+            self.assertEqual(stats['PolePlot.plot: ' + name]['calls'], 1)
+
+
+class Test_Profile_Store(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'markers.json')
+        self.markerdict = {
+            'Current': 'Default',
+            'Default': {'100': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}},
+            'Other': {'111': {'color': [4, 5, 6], 'marker': 's', 'ms': 9}}}
+        with open(self.path, 'w') as fp:
+            json.dump(self.markerdict, fp)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testCachedUntilFileChanges(self):
+        store = ProfileStore(self.path)
+        self.assertEqual(store.current(), self.markerdict['Default'])
+        version = store.version
+        self.assertIs(store.current(), store.current())
+        self.assertEqual(store.version, version)
+        self.markerdict['Current'] = 'Other'
+        with open(self.path, 'w') as fp:
+            json.dump(self.markerdict, fp, indent=4)
+        self.assertEqual(store.current(), self.markerdict['Other'])
+        self.assertGreater(store.version, version)
+
+    def testUpdateKeepsOtherProfiles(self):
+        store = ProfileStore(self.path)
+        new = {'110': {'color': [7, 8, 9], 'marker': 'v', 'ms': 1}}
+        store.update({'New': new}, deleted=['Other'], current='New')
+        with open(self.path) as fp:
+            saved = json.load(fp)
+        self.assertEqual(saved['Current'], 'New')
+        self.assertEqual(saved['New'], new)
+        self.assertEqual(saved['Default'], self.markerdict['Default'])
+        self.assertNotIn('Other', saved)
+        self.assertEqual(os.listdir(self.directory.name), ['markers.json'])
+
+    def testCompiledProfile(self):
+        store = ProfileStore(self.path)
+        compiled = store.compiled('Other')
+        self.assertIs(store.compiled('Other'), compiled)
+        self.assertEqual(len(compiled), 8)
+        self.assertEqual(len(np.unique(compiled.directions, axis=0)), 8)
+        np.testing.assert_array_equal(np.abs(compiled.directions), 1)
+        np.testing.assert_array_equal(compiled.sizes, 9)
+        np.testing.assert_almost_equal(compiled.colors[0],
+                                       np.array([4, 5, 6]) / 255)
+        self.assertEqual(compiled.labels[0],
+                         int_direction_to_bar_string(compiled.directions[0]))
+        default = store.compiled()
+        self.assertEqual(default.families, ['100'])
+        self.assertEqual(len(default), 2)
+        np.testing.assert_array_equal(default.bounds, [0, 2])
+
+    def testMarkerGroups(self):
+        store = ProfileStore(self.path)
+        compiled = store.compiled('Other')
+        self.assertEqual([marker for marker, _ in compiled.marker_groups],
+                         ['s'])
+        np.testing.assert_array_equal(compiled.marker_groups[0][1],
+                                      np.arange(8))
+
+
+class Test_Pole_Cache(unittest.TestCase):
+
+    def testLeastRecentlyUsed(self):
+        cache = PoleCache(maxsize=2)
+        self.assertEqual(cache.get('a', lambda: 1), 1)
+        self.assertEqual(cache.get('b', lambda: 2), 2)
+        self.assertEqual(cache.get('a', lambda: None), 1)
+        cache.get('c', lambda: 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b', lambda: 4), 4)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def testRendererReusesPoles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    '112': {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}}}, fp)
+            cache = PoleCache()
+            renderer = PoleRenderer(markers=path, cache=cache)
+            crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2],
+                              12, [1, -1, 0], [0, 1, 0], 5, -8)
+            renderer.plot(crystal)
+            offsets = renderer.pole_scatters[0].get_offsets().copy()
+            renderer.plot(crystal)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            np.testing.assert_array_equal(
+                renderer.pole_scatters[0].get_offsets(), offsets)
+            crystal.a0 = 6
+            renderer.plot(crystal)
+            self.assertEqual(cache.misses, 2)
+            renderer.plot(crystal, xlim=30)
+            self.assertEqual(cache.misses, 3)
+            crystal.basis = [[0, 0, 0], [0.25, 0.25, 0.25, 2]]
+            renderer.plot(crystal, xlim=30)
+            crystal.basis = np.array([[0, 0, 0], [0.25, 0.25, 0.25]])
+            renderer.plot(crystal, xlim=30)
+            crystal.basis = [[0, 0, 0], [0.25, 0.25, 0.25]]
+            renderer.plot(crystal, xlim=30)
+            self.assertEqual((cache.hits, cache.misses), (2, 5))
+
+    def testNearestPoleOnScreen(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    family: {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}
+                    for family in ('100', '110', '111', '112')}}, fp)
+            renderer = PoleRenderer(markers=path, cache=None)
+            crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2],
+                              12, [1, -1, 0], [0, 1, 0], 5, -8)
+            renderer.plot(crystal, xlim=15, ylim=10)
+            shown = np.concatenate([sc.get_offsets()
+                                    for sc in renderer.pole_scatters])
+            self.assertLess(len(renderer.pole_vectors),
+                            len(renderer._profile.directions))
+            for alpha in (-40, -15, 0, 15, 40):
+                for beta in (-40, -10, 0, 10, 40):
+                    _, _, tilts = renderer.nearest_pole(alpha, beta)
+                    self.assertLessEqual(abs(tilts[0]), 15)
+                    self.assertLessEqual(abs(tilts[1]), 10)
+                    self.assertTrue(np.isclose(shown, tilts).all(axis=1).any())
+            renderer.plot(crystal, xlim=0.1, ylim=0.1)
+            self.assertIsNone(renderer.nearest_pole(0, 0))
+
+
+class Test_Pole_Renderer(unittest.TestCase):
+
+    def testReplotReusesArtists(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            with open(path, 'w') as fp:
+                json.dump({'Current': 'Default', 'Default': {
+                    family: {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}
+                    for family in ('100', '110', '111')}}, fp)
+            renderer = PoleRenderer(markers=path, cache=None)
+            canvas = FigureCanvasAgg(renderer.fig)
+            ax = renderer.ax
+            hover = HoverAnnotation(canvas, ax, ax.annotate('', xy=(0, 0)))
+            crystal = Crystal('C', 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2],
+                              12, [1, -1, 0], [0, 1, 0], 5, -8)
+
+            def replot():
+                renderer.plot(crystal, 5, -3, 20)
+                hover.set_layers(renderer.hover_layers())
+                canvas.draw()
+                return ([sc.get_offsets().copy() for sc in ax.collections],
+                        list(ax.collections))
+
+            def counts():
+                return (len(ax.collections), len(ax.lines), len(ax.texts),
+                        len(renderer.fig.texts),
+                        {event: len(callbacks) for event, callbacks in
+                         canvas.callbacks.callbacks.items()})
+
+            offsets, artists = replot()
+            before = counts()
+            crystal.a0 = 20
+            new_offsets, new_artists = replot()
+            self.assertEqual(len(artists), len(new_artists))
+            for artist, new_artist in zip(artists, new_artists):
+                self.assertIs(artist, new_artist)
+            self.assertIs(hover.annot, ax.texts[0])
+            self.assertTrue(any(
+                offset.shape != new_offset.shape or
+                not np.allclose(offset, new_offset)
+                for offset, new_offset in zip(offsets, new_offsets)))
+            replot()
+            self.assertEqual(counts(), before)
+
+
+class Test_Batch_Render(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.markers = os.path.join(self.directory.name, 'markers.json')
+        with open(self.markers, 'w') as fp:
+            json.dump({'Current': 'Default', 'Default': {
+                family: {'color': [1, 2, 3], 'marker': 'o', 'ms': 5}
+                for family in ('100', '110', '111')}}, fp)
+        self.sample = Sample()
+        self.sample.crystals = [
+            Crystal(name, 'Cubic', 1, 1, 1, 90, 90, 90, [1, 1, 2], rotation,
+                    [1, -1, 0], [0, 1, 0], 5, -8)
+            for name, rotation in (('A', 12), ('B', 40))]
+        self.sample_path = os.path.join(self.directory.name, 'sample.json')
+        self.sample.save(self.sample_path)
+        self.views = [{'crystal': 'B', 'name': 'b',
+                       'interface': [5, -3, 20]},
+                      {'xlim': 30, 'poles': 'plane'}]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testMakeJobs(self):
+        jobs = make_jobs(self.sample, self.views, 'out', 'svg', self.markers)
+        self.assertEqual([job[2] for job in jobs],
+                         [os.path.join('out', name) for name in
+                          ('b.svg', 'A_view001.svg', 'B_view001.svg')])
+        self.assertEqual(jobs[0][0], self.sample.crystals[1].to_dict())
+
+    def testRenderSample(self):
+        output = os.path.join(self.directory.name, 'plots')
+        paths = render_sample(self.sample_path, self.views, output,
+                              markers=self.markers, size=(2, 2), dpi=50,
+                              workers=1)
+        self.assertEqual(sorted(os.listdir(output)),
+                         ['A_view001.png', 'B_view001.png', 'b.png'])
+        self.assertEqual(paths, [os.path.join(output, name) for name in
+                                 ('b.png', 'A_view001.png', 'B_view001.png')])
+        for path in paths:
+            with open(path, 'rb') as fp:
+                self.assertEqual(fp.read(8), b'\x89PNG\r\n\x1a\n')
+
+
+class Test_Marker_Families(unittest.TestCase):
+
+    def testMatchesListDedupe(self):
+        families = []
+        for i in range(8):
+            for j in range(8):
+                for k in range(8):
+                    if 0 < i + j + k < 10 and all(
+                            [i / d, j / d, k / d] not in families
+                            for d in range(2, 9)):
+                        families.append([i, j, k])
+        self.assertEqual(make_marker_json.direction_families().tolist(),
+                         families)
+
+    def testReducedAndUnique(self):
+        families = make_marker_json.direction_families(12, None)
+        self.assertEqual(families.max(), 12)
+        np.testing.assert_array_equal(np.gcd.reduce(families, axis=1), 1)
+        self.assertEqual(len(np.unique(families, axis=0)), len(families))
+        profile = make_marker_json.make_profile(families)
+        self.assertEqual([string_direction_to_int(key) for key in profile],
+                         families.tolist())
+
+    def testMinAngle(self):
+        families = make_marker_json.direction_families(6, None, min_angle=5)
+        vectors = families / np.linalg.norm(families, axis=1)[:, None]
+        cosines = vectors @ vectors.T
+        np.fill_diagonal(cosines, 0)
+        self.assertLessEqual(cosines.max(), np.cos(np.radians(5)))
+        self.assertEqual(families[:3].tolist(),
+                         [[0, 0, 1], [0, 1, 0], [1, 0, 0]])
+
+    def testMinAngleBlocks(self):
+        families = make_marker_json.direction_families(8, None, min_angle=4,
+                                                       block=1)
+        for block in (7, 100, 10000):
+            np.testing.assert_array_equal(
+                make_marker_json.direction_families(8, None, min_angle=4,
+                                                    block=block), families)
+
+    def testWriteProfile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'markers.json')
+            make_marker_json.write_profile({'100': {}}, 'A', path)
+            make_marker_json.write_profile({'111': {}}, 'B', path)
+            with open(path) as fp:
+                saved = json.load(fp)
+        self.assertEqual(saved, {'Current': 'B', 'A': {'100': {}},
+                                 'B': {'111': {}}})
+
+
+class Test_Point_Index(unittest.TestCase):
+
+    def testMatchesBruteForce(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(0, 500, (2000, 2))
+        points[::97] = np.nan
+        radii = rng.uniform(1, 8, len(points))
+        index = PointIndex(points, radii)
+        for x, y in rng.uniform(0, 500, (300, 2)):
+            distance = np.hypot(points[:, 0] - x, points[:, 1] - y)
+            hits = np.flatnonzero(distance <= radii)
+            expected = hits[np.argmin(distance[hits])] if len(hits) else None
+            self.assertEqual(index.query(x, y), expected)
+
+    def testPriority(self):
+        index = PointIndex([[0, 0], [1, 0]], [5, 5], priority=[1, 0])
+        self.assertEqual(index.query(0, 0), 1)
+        self.assertIsNone(PointIndex(np.empty((0, 2)), 0).query(0, 0))
+
+
+class Test_Sample_File(unittest.TestCase):
+
+    def testRoundTrip(self):
+        sample = Sample()
+        sample.crystals = [
+            Crystal('A', 'Cubic', 4, 4, 4, 90, 90, 90, np.array([1, 1, 2]),
+                    np.float64(12.5), [1, -1, 0], [0, 0, 1], 5, -8),
+            Crystal('B', 'Hexagonal', 3, 3, 5, 90, 90, 120, [0, 0, 1], 30,
+                    [1, 0, 0], [0, 1, 0], -3, 4)]
+        sample.crystals[0].add_known_pole(1, 0, 0, 3.5, 4)
+        sample.rotation = 15
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sample.json')
+            sample.save(path)
+            loaded = Sample(path)
+        self.assertEqual(loaded.to_dict(), sample.to_dict())
+        self.assertEqual(loaded.rotation, 15)
+        self.assertEqual(loaded.crystals[0].knownPoles, [[1, 0, 0, 3.5, 4]])
+        np.testing.assert_almost_equal(
+            loaded.crystal('B').orientation_matrix,
+            sample.crystals[1].orientation_matrix)
+        self.assertEqual(Sample.crystals, [])
+
+
+class Test_Blit_Manager(unittest.TestCase):
+
+    def testBlitsOverBackground(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(2, 2), dpi=50)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        text = ax.text(0.5, 0.5, 'annotation', fontsize=20)
+        manager = BlitManager(canvas, [text])
+        self.assertTrue(text.get_animated())
+        canvas.draw()
+        shown = np.asarray(canvas.buffer_rgba()).copy()
+        text.set_visible(False)
+        manager.update()
+        hidden = np.asarray(canvas.buffer_rgba()).copy()
+        self.assertTrue((shown != hidden).any())
+        text.set_visible(True)
+        manager.update()
+        np.testing.assert_array_equal(canvas.buffer_rgba(), shown)
+
+
+class Test_Stage_Feed(unittest.TestCase):
+
+    def testSourceMustRead(self):
+        class Source(StagePositionSource):
+            pass
+        self.assertRaises(TypeError, Source)
+
+    def testSimulatedFeed(self):
+        clock = iter([0.0, 0.0, 1.75]).__next__
+        feed = SimulatedStageFeed(amplitude=(30, 10), period=(7, 7),
+                                  clock=clock)
+        np.testing.assert_almost_equal(feed.read(), (0, 0))
+        np.testing.assert_almost_equal(feed.read(), (30, 10))
+
+    def testLatestPositionFeed(self):
+        feed = LatestPositionFeed()
+        self.assertIsNone(feed.read())
+        feed.put(1, 2)
+        feed.put(3, 4)
+        self.assertEqual(feed.read(), (3, 4))
+        self.assertIsNone(feed.read())
+
+
 class Test_Zero_Tilt_Direction(unittest.TestCase):
     knownValues = ( ([0, 0, 1], 0, 0, [0, 1, 0], 0, [0,0,1], [0,1,0]),
                     ([1, 0, 0], 0, 0, [0, -1, 0], 0, [1, 0, 0], [0, -1, 0]),
@@ -0,0 +1,71 @@
+"""
+Sources of the live stage position shown by PolePlot.start_stage_feed.
+
+A source only has to implement read(), returning the latest (alpha, beta)
+stage tilts in degrees, or None if there is no new position. It is polled
+from the GUI thread, so read() must not block.
+"""
+import abc
+import math
+import random
+import threading
+import time
+
+
+class StagePositionSource(abc.ABC):
+    """Base class of stage position feeds."""
+
+    @abc.abstractmethod
+    def read(self):
+        """Latest (alpha, beta) in degrees, or None if nothing new."""
+
+    def close(self):
+        pass
+
+
+class LatestPositionFeed(StagePositionSource):
+    """
+    Feed for positions pushed from another thread, e.g. a microscope
+    driver callback. Only the latest position is kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._position = None
+
+    def put(self, alpha, beta):
+        with self._lock:
+            self._position = (alpha, beta)
+
+    def read(self):
+        with self._lock:
+            position, self._position = self._position, None
+        return position
+
+
+class SimulatedStageFeed(StagePositionSource):
+    """
+    Stage moving along a Lissajous curve, for testing without a microscope.
+    :param amplitude: (alpha, beta) amplitudes in degrees.
+    :param period: (alpha, beta) periods in seconds.
+    :param noise: standard deviation of added jitter in degrees.
+    :param clock: function returning the time in seconds.
+    """
+
+    def __init__(self, amplitude=(30, 30), period=(7.0, 11.0), noise=0.0,
+                 clock=time.monotonic, seed=None):
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.clock = clock
+        self._random = random.Random(seed)
+        self._start = clock()
+
+    def read(self):
+        t = self.clock() - self._start
+        alpha = self.amplitude[0] * math.sin(2 * math.pi * t / self.period[0])
+        beta = self.amplitude[1] * math.sin(2 * math.pi * t / self.period[1])
+        if self.noise:
+            alpha += self._random.gauss(0, self.noise)
+            beta += self._random.gauss(0, self.noise)
+        return alpha, beta
@@ -6,10 +6,11 @@ import matplotlib
 matplotlib.use('QT5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.figure
-import json
 
 from crystal_math import *
 from pole_plot import PolePlot
+from profile_store import get_store
+from hover import HoverAnnotation
 
 def clearLayout(layout):
     while layout.count():
@@ -88,18 +89,11 @@ class TiltPointFrame(QtWidgets.QWidget):
         headerBox.addStretch(99)
 
 
-        # get coordinates
-        if along:
-            coordinates = along_interface_tilt_coordinates(
-                a0, b0, rotation, step_size)
-        else:
-            coordinates = normal_to_interface_tilt_coordinates(
-                a0, b0, rotation, step_size
-            )
-        good_coordinates = []
-        for x, y in coordinates:
-            if abs(x) < alpha_max and abs(y) < beta_max:
-                good_coordinates.append([x,y])
+        # get coordinates inside the holder limits
+        if not along:
+            rotation = rotation + 90
+        good_coordinates = interface_tilt_path(a0, b0, rotation, step_size,
+                                               alpha_max, beta_max)
 
         # Container Widget
         widget = QtWidgets.QWidget()
@@ -140,6 +134,7 @@ class TiltSeriesPlot(FigureCanvas):
                                    QtWidgets.QSizePolicy.Expanding,
                                    QtWidgets.QSizePolicy.Expanding)
         self.updateGeometry()
+        self.hover_annotation = HoverAnnotation(self, self.ax)
 
     def plot(self, crystal, interface_alpha=None, interface_beta=None,
              interface_rotation=None, xlim=45, ylim=45):
@@ -148,7 +143,6 @@ class TiltSeriesPlot(FigureCanvas):
         self.fig.tight_layout()
         self.ax.axis('on')
 
-        fig = self.fig
         ax.spines['left'].set_position('zero')
         ax.spines['right'].set_color('none')
         ax.spines['bottom'].set_position('zero')
@@ -185,9 +179,7 @@ class TiltSeriesPlot(FigureCanvas):
                                                       crystal.beta,
                                                       crystal.gamma)
             # get family of directions
-            with open('data/markers.json', 'r') as fp:
-                ddict = json.load(fp)
-                direction_dict = ddict[ddict['Current']]
+            direction_dict = get_store().current()
 
             # print(direction_dict['111'])
 
@@ -275,38 +267,11 @@ class TiltSeriesPlot(FigureCanvas):
                             fontweight='bold')
         annot.set_visible(False)
 
-        def update_annot(sc, ind, color, i):
-
-            pos = sc.get_offsets()[ind["ind"][0]]
-            annot.xy = pos
-            try:
-                text = ''.join(('<', names[i][ind["ind"][0]], '>',
-                                '\nX tilt = ', str(pos[0]),
-                                ', Y tilt = ', str(pos[1])))
-            except:
-                text = ''.join((names[i],
-                                '\nX tilt = ', str(pos[0]),
-                                ', Y tilt = ', str(pos[1])))
-            annot.set_text(text)
-            annot.get_bbox_patch().set_facecolor(color)
-            annot.get_bbox_patch().set_alpha(0.8)
-
-        def hover(event):
-            vis = annot.get_visible()
-            if event.inaxes == ax:
-                for i, sc in enumerate(scs):
-                    cont, ind = sc.contains(event)
-                    if cont:
-                        update_annot(sc, ind, colors[i], i)
-                        annot.set_visible(True)
-                        fig.canvas.draw_idle()
-                        break
-                else:
-                    if vis:
-                        annot.set_visible(False)
-                        fig.canvas.draw_idle()
-
-        fig.canvas.mpl_connect("motion_notify_event", hover)
+        # per-direction names are shown as <uvw>
+        names = [name if isinstance(name, str) else
+                 ['<%s>' % n for n in name] for name in names]
+        self.hover_annotation.annot = annot
+        self.hover_annotation.set_layers(zip(scs, names, colors))
 
         self.draw_idle()
 